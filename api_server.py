@@ -4,12 +4,14 @@ Flask API Server pro Universal Image Processor
 Integrace s Node.js/React aplikací
 """
 
+import os
 import sys
 import logging
 
-# Setup logging first
+# Setup logging first - DEBUG jen při FLASK_DEBUG=1, v produkci INFO
+# (logger.debug s %-formátováním pak argumenty vůbec neformátuje)
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=logging.DEBUG if os.environ.get('FLASK_DEBUG') == '1' else logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
     stream=sys.stdout
 )
@@ -20,60 +22,173 @@ logging.getLogger('PIL').setLevel(logging.WARNING)
 logger.info("🔧 Starting imports...")
 
 try:
-    from flask import Flask, request, jsonify, send_file, send_from_directory
+    from flask import Flask, request, jsonify, send_from_directory
     from flask_cors import CORS
+    from flask_compress import Compress
+    from whitenoise import WhiteNoise
+    from flask.json.provider import JSONProvider
+    import orjson
     from werkzeug.utils import secure_filename
-    import os
+    from werkzeug.exceptions import RequestEntityTooLarge
+    import copy
+    import shutil
     import tempfile
-    import json
+    import threading
+    import atexit
+    from contextlib import contextmanager
+    import functools
+    import zipfile
+    from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
     from pathlib import Path
-    from universal_processor import UniversalProcessor
+    from universal_processor import UniversalProcessor, OUTPUT_FORMATS
     import base64
+    import binascii
     from io import BytesIO
     logger.info("✅ All imports successful")
 except Exception as e:
-    logger.error(f"❌ Import error: {e}", exc_info=True)
+    logger.error("❌ Import error: %s", e, exc_info=True)
     raise
 
 
+class ORJSONProvider(JSONProvider):
+    """JSON provider nad orjson - rychlejší (de)serializace velkých base64 odpovědí"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 app.static_folder = 'static'
 app.static_url_path = ''
 CORS(app)  # Povolí CORS pro React aplikaci
 
+# Komprese odpovědí (gzip/brotli) - base64 JSON a textové assety se dobře komprimují.
+# image/* a application/zip záměrně chybí, jsou už komprimované.
+app.config['COMPRESS_MIMETYPES'] = [
+    'application/json',
+    'text/html',
+    'text/css',
+    'text/javascript',
+    'application/javascript'
+]
+app.config['COMPRESS_LEVEL'] = 6
+app.config['COMPRESS_MIN_SIZE'] = 1024
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+# Zachová 304 odpovědi (ETag/If-None-Match) pro statické soubory
+app.config['COMPRESS_EVALUATE_CONDITIONAL_REQUEST'] = True
+Compress(app)
+
+# Statické assety (style.css, script.js) servíruje WhiteNoise mimo Flask request cyklus -
+# ETag/304 a předkomprimované .gz/.br varianty (python -m whitenoise.compress static/).
+# Jména souborů nejsou hashovaná, proto krátký výchozí max_age.
+app.wsgi_app = WhiteNoise(
+    app.wsgi_app,
+    root=app.static_folder,
+    max_age=int(os.environ.get('STATIC_MAX_AGE', 3600)),
+    autorefresh=os.environ.get('FLASK_DEBUG') == '1'
+)
+
 # Přidáme error handler pro 500 chyby
 @app.errorhandler(500)
 def internal_error(error):
     import traceback
     error_details = traceback.format_exc()
-    print(f"❌ 500 ERROR: {error}")
-    print(f"📋 TRACEBACK: {error_details}")
+    logger.error("❌ 500 ERROR: %s\n📋 TRACEBACK: %s", error, error_details)
     return jsonify({
         'error': str(error),
         'details': error_details,
         'type': 'Internal Server Error'
     }), 500
 
+@app.errorhandler(413)
+def payload_too_large(error=None):
+    """JSON odpověď pro příliš velký request (místo HTML stránky Werkzeugu)"""
+    return jsonify({
+        'error': 'File too large',
+        'max_bytes': app.config['MAX_CONTENT_LENGTH']
+    }), 413
+
+@app.before_request
+def reject_oversized_request():
+    """Odmítne příliš velké tělo podle Content-Length ještě před parsováním/ukládáním.
+    
+    Chunked těla bez Content-Length přetečou limit až při čtení - endpointy proto
+    RequestEntityTooLarge zachytávají zvlášť, aby nespadla do obecného 500.
+    """
+    if request.content_length is not None and request.content_length > app.config['MAX_CONTENT_LENGTH']:
+        return payload_too_large()
+
 # Konfigurace
 UPLOAD_FOLDER = 'temp_uploads'
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'bmp', 'tiff', 'webp'}
+ALLOWED_EXTENSIONS = frozenset({'.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.webp'})
+
+# Maximální velikost requestu (platí pro multipart i raw stream)
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_MB', 50)) * 1024 * 1024
+# Velikost bloku při kopírování raw streamu na disk
+STREAM_CHUNK_SIZE = 1 << 20
 
 # Vytvoření složky pro uploady
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return os.path.splitext(filename)[1].lower() in ALLOWED_EXTENSIONS
 
-def get_processor_config(custom_config=None):
-    """Vrátí konfiguraci pro procesor"""
-    # Načteme konfiguraci z config.json
+# Scratch prostor pro requesty - jedna složka na worker proces, v ní mkdtemp per request.
+# SCRATCH_DIR=/dev/shm drží uploady v RAM (tmpfs).
+SCRATCH_ROOT = Path(os.environ.get('SCRATCH_DIR') or tempfile.gettempdir())
+_scratch_workers = set()
+
+def _scratch_worker_dir():
+    """Vrátí scratch složku aktuálního procesu, při prvním použití ji založí a zaregistruje úklid"""
+    # pid až při volání - gunicorn workery vznikají forkem
+    pid = os.getpid()
+    worker_dir = SCRATCH_ROOT / f'imgproc-{pid}'
+    if pid not in _scratch_workers:
+        worker_dir.mkdir(parents=True, exist_ok=True)
+        atexit.register(_cleanup_scratch_worker, pid, worker_dir)
+        _scratch_workers.add(pid)
+    return worker_dir
+
+def _cleanup_scratch_worker(pid, worker_dir):
+    # atexit handlery se dědí forkem - každý proces uklízí jen svou složku
+    if os.getpid() == pid:
+        shutil.rmtree(worker_dir, ignore_errors=True)
+
+@contextmanager
+def scratch_req():
+    """Přidělí requestu podsložku ve scratch prostoru workeru a po skončení ji uklidí"""
+    # mkdtemp - unikátní jméno i při zbytcích po procesu se stejným pid
+    req_dir = tempfile.mkdtemp(prefix='r', dir=_scratch_worker_dir())
+    try:
+        yield req_dir
+    finally:
+        shutil.rmtree(req_dir, ignore_errors=True)
+
+# Naparsovaný config.json - znovu se načte jen když se soubor změní
+_config_cache = {'stamp': None, 'config': {}}
+
+def load_file_config():
+    """Vrátí obsah config.json, parsuje ho jen při změně mtime/velikosti"""
     try:
-        with open('config.json', 'r') as f:
-            file_config = json.load(f)
-            print(f"📋 Načtena konfigurace z config.json: {file_config}")
+        st = os.stat('config.json')
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp != _config_cache['stamp']:
+            with open('config.json', 'rb') as f:
+                _config_cache['config'] = orjson.loads(f.read())
+            _config_cache['stamp'] = stamp
+            logger.debug("📋 Načtena konfigurace z config.json: %s", _config_cache['config'])
+        return _config_cache['config']
     except Exception as e:
-        print(f"⚠️ Chyba při načítání config.json: {e}")
-        file_config = {}
+        logger.warning("⚠️ Chyba při načítání config.json: %s", e)
+        return {}
+
+def get_processor_config(custom_config=None):
+    """Vrátí konfiguraci pro procesor"""
+    file_config = load_file_config()
     
     default_config = {
         'target_width': 1000,
@@ -103,9 +218,136 @@ def get_processor_config(custom_config=None):
     # flatten_png_first MUSÍ být False pro správnou alfa kompozici
     default_config['flatten_png_first'] = False
     
-    print(f"🎯 Finální konfigurace: {default_config}")
     return default_config
 
+def parse_custom_config(config_data):
+    """Načte konfiguraci requestu z JSON textu (formulář/hlavička).
+    
+    Nevalidní JSON nebo jiný typ než objekt vyhodí ValueError (chyba klienta -> 400).
+    """
+    custom_config = orjson.loads(config_data) if config_data else {}
+    if not isinstance(custom_config, dict):
+        raise ValueError('Config must be a JSON object')
+    return custom_config
+
+# Chybný typ nebo hodnota v konfiguraci requestu (z __init__ procesoru) = chyba klienta
+CONFIG_ERRORS = (ValueError, TypeError, AttributeError)
+
+def build_processor_config(custom_config):
+    """Sestaví konfiguraci procesoru z konfigurace requestu a ověří ji.
+    
+    Ověření = sestavení sdílené (cachované) instance procesoru, takže chybná hodnota
+    se projeví hned a ne až při zpracování. Vyhazuje CONFIG_ERRORS (-> 400).
+    """
+    if custom_config is not None and not isinstance(custom_config, dict):
+        raise ValueError('Config must be a JSON object')
+    processor_config = get_processor_config(custom_config)
+    get_shared_processor(processor_config)
+    return processor_config
+
+def send_bytes(data, mimetype, download_name):
+    """Odešle výsledek z paměti jako přílohu jedním zápisem.
+    
+    send_file(BytesIO) by tělo posílal přes wsgi.file_wrapper po 8 KB blocích
+    (sendfile bez fd nejde); bytes tělo má Content-Length a gunicorn ho zapíše najednou.
+    """
+    response = app.response_class(data, mimetype=mimetype)
+    response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    response.cache_control.no_cache = True
+    return response
+
+def process_saved_image(temp_dir, filename, processor_config):
+    """Zpracuje obrázek uložený v temp_dir a vrátí ho jako přílohu"""
+    input_path = os.path.join(temp_dir, filename)
+    
+    logger.debug("Processor config: %s", processor_config)
+    logger.debug("Input path: %s", input_path)
+    
+    processor = get_processor(processor_config, temp_dir, temp_dir)
+    
+    # Zpracování přímo do paměti - výstup se nezapisuje a znovu nečte z disku
+    processed_data = processor.process_image_to_bytes(Path(input_path))
+    
+    logger.debug("Processing result: %s", processed_data is not None)
+    
+    if processed_data is None:
+        return jsonify({'error': 'Failed to process image'}), 500
+    
+    suffix, mimetype = OUTPUT_FORMATS.get(processor.output_format, OUTPUT_FORMATS['jpeg'])
+    download_filename = f"processed_{os.path.splitext(filename)[0]}{suffix}"
+    
+    # Odeslání zpracovaného obrázku
+    return send_bytes(processed_data, mimetype, download_filename)
+
+# Klíče, které se mění per-request a nesmí být součástí cache klíče
+_PATH_KEYS = ('input_dir', 'output_dir')
+_processor_lock = threading.Lock()
+
+def _freeze(value):
+    """Převede hodnotu konfigurace na hashovatelnou (dict -> frozenset, list -> tuple)"""
+    if isinstance(value, dict):
+        return frozenset((k, _freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+@functools.lru_cache(maxsize=8)
+def _cached_processor(cfg_key):
+    # Sdílená instance vlastní cesty nemá - dostane scratch kořen, aby __init__
+    # nezakládal processed_images v pracovní složce serveru (ta může být read-only)
+    scratch = str(SCRATCH_ROOT)
+    return UniversalProcessor(dict(cfg_key, input_dir=scratch, output_dir=scratch))
+
+def get_shared_processor(processor_config):
+    """Vrátí sdílenou (cachovanou) instanci procesoru pro danou konfiguraci.
+    
+    Cesty se nenastavují - použitelné jen pro zpracování v paměti.
+    """
+    cfg_key = frozenset(
+        (k, _freeze(v)) for k, v in processor_config.items() if k not in _PATH_KEYS
+    )
+    with _processor_lock:
+        return _cached_processor(cfg_key)
+
+def get_processor(processor_config, input_dir, output_dir):
+    """Vrátí procesor pro danou konfiguraci s nastavenými cestami.
+    
+    Instance se cachují podle konfigurace (bez cest), takže opakované requesty
+    přeskočí inicializaci. Každý request dostane mělkou kopii, aby souběžná
+    vlákna nesdílela input_dir/output_dir.
+    """
+    processor = copy.copy(get_shared_processor(processor_config))
+    processor.set_paths(input_dir, output_dir)
+    return processor
+
+def _iter_files(root):
+    """Rekurzivně vrací cesty souborů pod root (os.scandir - stat z DirEntry bez dalších syscallů)"""
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.is_file():
+                yield entry.path
+            elif entry.is_dir():
+                yield from _iter_files(entry.path)
+
+# /api/process-base64 zpracovává v paměti v omezeném poolu vláken (max počet CPU na worker),
+# vlákna requestů jen čekají na výsledek - souběžné requesty se tak nepřetahují o CPU
+# Čekání na výsledek s rezervou pod gunicorn timeoutem (120 s), aby stihlo odejít 504
+BASE64_RESULT_TIMEOUT = 90  # s
+
+_base64_pool_lock = threading.Lock()
+_base64_pool = None
+_base64_pool_pid = None
+
+def submit_in_memory(processor, data):
+    """Zařadí zpracování obrázku (bytes) do poolu a vrátí Future s výsledkem (bytes nebo None)"""
+    global _base64_pool, _base64_pool_pid
+    with _base64_pool_lock:
+        # Pool se zakládá líně a po forku znovu - vlákna rodiče v gunicorn workeru neexistují
+        if _base64_pool is None or _base64_pool_pid != os.getpid():
+            _base64_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='base64')
+            _base64_pool_pid = os.getpid()
+    return _base64_pool.submit(processor.process_image_to_bytes, BytesIO(data))
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -118,113 +360,102 @@ def health_check():
 @app.route('/api/process-single', methods=['POST'])
 def process_single_image():
     """Zpracuje jeden obrázek"""
-    logger.info("🔍 DEBUG: Začínám process_single_image")
-    print("🔍 DEBUG: Začínám process_single_image")
+    logger.debug("Začínám process_single_image")
     try:
-        print("🔍 DEBUG: Kontroluji soubor v requestu")
         # Kontrola, zda je soubor v requestu
         if 'image' not in request.files:
-            print("❌ CHYBA: No image file provided")
+            logger.debug("No image file provided")
             return jsonify({'error': 'No image file provided'}), 400
         
         file = request.files['image']
-        print(f"🔍 DEBUG: Soubor: {file.filename}")
+        logger.debug("Soubor: %s", file.filename)
         if file.filename == '':
-            print("❌ CHYBA: No file selected")
+            logger.debug("No file selected")
             return jsonify({'error': 'No file selected'}), 400
         
         if not allowed_file(file.filename):
-            print(f"❌ CHYBA: Invalid file type: {file.filename}")
+            logger.debug("Invalid file type: %s", file.filename)
             return jsonify({'error': 'Invalid file type'}), 400
         
-        print("🔍 DEBUG: Získávám konfiguraci")
         # Získání konfigurace z requestu
         config_data = request.form.get('config', '{}')
-        print(f"🔍 DEBUG: Config data: {config_data}")
-        custom_config = json.loads(config_data) if config_data else {}
-        print(f"🔍 DEBUG: Custom config: {custom_config}")
+        logger.debug("Config data: %s", config_data)
+        try:
+            processor_config = build_processor_config(parse_custom_config(config_data))
+        except CONFIG_ERRORS as e:
+            return jsonify({'error': f'Invalid config: {e}'}), 400
         
-        print("🔍 DEBUG: Vytvářím dočasnou složku")
         # Vytvoření dočasné složky
-        with tempfile.TemporaryDirectory() as temp_dir:
-            print(f"🔍 DEBUG: Dočasná složka vytvořena: {temp_dir}")
-            
+        with scratch_req() as temp_dir:
             # Uložení uploadovaného souboru
             filename = secure_filename(file.filename)
             input_path = os.path.join(temp_dir, filename)
-            print(f"🔍 DEBUG: Ukládám soubor do: {input_path}")
+            logger.debug("Ukládám soubor do: %s", input_path)
             
             try:
                 file.save(input_path)
-                print(f"🔍 DEBUG: Soubor úspěšně uložen: {input_path}")
             except Exception as save_error:
-                print(f"❌ CHYBA při ukládání souboru: {save_error}")
+                logger.error("❌ CHYBA při ukládání souboru: %s", save_error)
                 return jsonify({'error': f'Failed to save file: {save_error}'}), 500
             
             # Kontrola, jestli soubor existuje
             if not os.path.exists(input_path):
-                print(f"❌ CHYBA: Soubor neexistuje: {input_path}")
+                logger.error("❌ CHYBA: Soubor neexistuje: %s", input_path)
                 return jsonify({'error': 'File was not saved properly'}), 500
             
-            print(f"🔍 DEBUG: Soubor existuje, velikost: {os.path.getsize(input_path)} bytes")
-            
-            # Vytvoření výstupní cesty (UniversalProcessor zachovává jméno, jen mění příponu)
-            # POZOR: UniversalProcessor nepřidává prefix "processed_" na disk!
-            actual_output_filename = f"{filename.rsplit('.', 1)[0]}.webp"
-            output_path = os.path.join(temp_dir, actual_output_filename)
-            
-            # Jméno pro stažení (tady chceme prefix)
-            download_filename = f"processed_{actual_output_filename}"
-            
-            print(f"🔍 DEBUG: Očekávám výstupní soubor na disku: {output_path}")
-            
-            # Zpracování obrázku
-            processor_config = get_processor_config(custom_config)
-            processor_config['input_dir'] = temp_dir
-            processor_config['output_dir'] = temp_dir
-            
-            print(f"Processor config: {processor_config}")
-            print(f"Input path: {input_path}")
-            print(f"Output path: {output_path}")
-            
-            processor = UniversalProcessor(processor_config)
-            
-            # Zpracování
-            success = processor.process_image(Path(input_path))
-            
-            # Kontrola, jestli výstupní soubor existuje
-            if not os.path.exists(output_path):
-                print(f"❌ CHYBA: Výstupní soubor neexistuje: {output_path}")
-                # Zkusíme najít jiné soubory ve složce
-                files_in_dir = os.listdir(temp_dir)
-                print(f"🔍 DEBUG: Soubory ve složce: {files_in_dir}")
-                return jsonify({'error': 'Output file not found'}), 500
-            
-            print(f"Processing result: {success}")
-            
-            if not success:
-                return jsonify({'error': 'Failed to process image'}), 500
-            
-            # Odeslání zpracovaného obrázku
-            return send_file(
-                output_path,
-                mimetype='image/webp',
-                as_attachment=True,
-                download_name=download_filename
-            )
+            return process_saved_image(temp_dir, filename, processor_config)
     
+    except RequestEntityTooLarge:
+        return payload_too_large()
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
-        print(f"❌ ERROR in process_single_image: {e}")
-        print(f"📋 TRACEBACK: {error_details}")
-        print(f"🔍 ERROR TYPE: {type(e).__name__}")
+        logger.error("❌ ERROR in process_single_image (%s): %s\n📋 TRACEBACK: %s",
+                     type(e).__name__, e, error_details)
         return jsonify({
             'error': str(e),
             'details': error_details,
             'type': type(e).__name__
         }), 500
 
+@app.route('/api/process-single-stream', methods=['POST'])
+def process_single_image_stream():
+    """Zpracuje jeden obrázek poslaný jako raw tělo requestu.
+    
+    Obchází multipart parser Werkzeugu - tělo se kopíruje po 1 MB blocích
+    rovnou na disk. Jméno souboru je v hlavičce X-Filename, volitelná
+    konfigurace jako JSON v hlavičce X-Config.
+    """
+    try:
+        filename = secure_filename(request.headers.get('X-Filename', ''))
+        if not filename:
+            return jsonify({'error': 'Missing X-Filename header'}), 400
+        
+        if not allowed_file(filename):
+            return jsonify({'error': 'Invalid file type'}), 400
+        
+        config_data = request.headers.get('X-Config', '{}')
+        try:
+            # Ověří se před čtením těla - chybná hodnota je chyba klienta, ne serveru
+            processor_config = build_processor_config(parse_custom_config(config_data))
+        except CONFIG_ERRORS as e:
+            return jsonify({'error': f'Invalid X-Config header: {e}'}), 400
+        
+        with scratch_req() as temp_dir:
+            input_path = os.path.join(temp_dir, filename)
+            with open(input_path, 'wb') as f:
+                shutil.copyfileobj(request.stream, f, STREAM_CHUNK_SIZE)
+            
+            if os.path.getsize(input_path) == 0:
+                return jsonify({'error': 'Empty request body'}), 400
+            
+            return process_saved_image(temp_dir, filename, processor_config)
+    
+    except RequestEntityTooLarge:
+        return payload_too_large()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/process-batch', methods=['POST'])
 def process_batch_images():
     """Zpracuje více obrázků najednou"""
@@ -239,70 +470,71 @@ def process_batch_images():
         
         # Získání konfigurace
         config_data = request.form.get('config', '{}')
-        custom_config = json.loads(config_data) if config_data else {}
+        try:
+            processor_config = build_processor_config(parse_custom_config(config_data))
+        except CONFIG_ERRORS as e:
+            return jsonify({'error': f'Invalid config: {e}'}), 400
         
         # Vytvoření dočasné složky
-        with tempfile.TemporaryDirectory() as temp_dir:
+        with scratch_req() as temp_dir:
             input_dir = os.path.join(temp_dir, 'input')
             output_dir = os.path.join(temp_dir, 'output')
             os.makedirs(input_dir, exist_ok=True)
             os.makedirs(output_dir, exist_ok=True)
             
-            # Uložení všech souborů
-            uploaded_files = []
+            # Platné soubory podle cílového jména (stejné jméno = poslední vyhrává, jako dřív)
+            uploads = {}
             for file in files:
                 if file and allowed_file(file.filename):
-                    filename = secure_filename(file.filename)
-                    file_path = os.path.join(input_dir, filename)
-                    file.save(file_path)
-                    uploaded_files.append(filename)
+                    uploads[secure_filename(file.filename)] = file
             
-            if not uploaded_files:
+            if not uploads:
                 return jsonify({'error': 'No valid files uploaded'}), 400
             
             # Zpracování
-            processor_config = get_processor_config(custom_config)
-            processor_config['input_dir'] = input_dir
-            processor_config['output_dir'] = output_dir
+            processor = get_processor(processor_config, input_dir, output_dir)
+            
+            def save_upload(item):
+                filename, file = item
+                file_path = Path(input_dir) / filename
+                file.save(str(file_path))
+                return file_path
             
-            processor = UniversalProcessor(processor_config)
-            results = processor.process_all_images()
+            # Ukládání a zpracování jako pipeline: soubory se ukládají souběžně a každý
+            # se hned po uložení posílá ke zpracování. Pillow/NumPy uvolňují GIL při
+            # dekódování a resize; rembg model je paměťově náročný, proto s AI jen 2 vlákna.
+            max_workers = 2 if processor.ai_background_removal else (os.cpu_count() or 1)
+            with ThreadPoolExecutor(max_workers=min(8, len(uploads))) as save_pool, \
+                    ThreadPoolExecutor(max_workers=min(max_workers, len(uploads))) as process_pool:
+                pending = [
+                    process_pool.submit(processor.process_one, path)
+                    for path in save_pool.map(save_upload, uploads.items())
+                ]
+                results = [future.result() for future in pending]
             
-            # Vytvoření ZIP souboru s výsledky
-            import zipfile
-            zip_path = os.path.join(temp_dir, 'processed_images.zip')
+            failed = [name for name, ok in results if not ok]
+            if failed:
+                logger.warning("⚠️ Nepodařilo se zpracovat: %s", failed)
             
-            with zipfile.ZipFile(zip_path, 'w') as zipf:
-                for root, dirs, files in os.walk(output_dir):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.relpath(file_path, output_dir)
-                        zipf.write(file_path, arcname)
+            # ZIP s výsledky v paměti - JPEG/WEBP/PNG jsou už komprimované,
+            # takže ZIP_STORED (bez rekomprese) ušetří CPU a nic nezvětší
+            zip_buffer = BytesIO()
+            with zipfile.ZipFile(zip_buffer, 'w', compression=zipfile.ZIP_STORED) as zipf:
+                for file_path in _iter_files(output_dir):
+                    zipf.write(file_path, os.path.relpath(file_path, output_dir))
             
-            return send_file(
-                zip_path,
-                mimetype='application/zip',
-                as_attachment=True,
-                download_name='processed_images.zip'
-            )
+            return send_bytes(zip_buffer.getvalue(), 'application/zip', 'processed_images.zip')
     
+    except RequestEntityTooLarge:
+        return payload_too_large()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/')
 def index():
     """Hlavní stránka s frontendem"""
-    return send_from_directory('static', 'index.html')
-
-@app.route('/style.css')
-def style_css():
-    """CSS soubor"""
-    return send_from_directory('static', 'style.css')
-
-@app.route('/script.js')
-def script_js():
-    """JavaScript soubor"""
-    return send_from_directory('static', 'script.js')
+    # max_age=0 + ETag: prohlížeč se vždy zeptá, ale při shodě dostane 304
+    return send_from_directory('static', 'index.html', max_age=0, conditional=True)
 
 
 
@@ -330,11 +562,13 @@ def update_config():
             return jsonify({'error': 'No configuration provided'}), 400
         
         # Uložení do config.json
-        with open('config.json', 'w', encoding='utf-8') as f:
-            json.dump(config_data, f, indent=2, ensure_ascii=False)
+        with open('config.json', 'wb') as f:
+            f.write(orjson.dumps(config_data, option=orjson.OPT_INDENT_2))
         
         return jsonify({'message': 'Configuration updated successfully'})
     
+    except RequestEntityTooLarge:
+        return payload_too_large()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -343,46 +577,52 @@ def process_base64_image():
     """Zpracuje obrázek v base64 formátu"""
     try:
         data = request.json
-        if not data or 'image' not in data:
+        if not isinstance(data, dict) or 'image' not in data:
             return jsonify({'error': 'No base64 image provided'}), 400
         
-        # Dekódování base64
-        image_data = base64.b64decode(data['image'])
+        raw = data['image']
+        if not isinstance(raw, str) or not raw:
+            return jsonify({'error': 'Invalid base64 image'}), 400
         
-        # Získání konfigurace
-        custom_config = data.get('config', {})
+        # Dekódování base64 přímo do bytes (bez mezikopie), výsledek zůstává v paměti
+        try:
+            image_data = binascii.a2b_base64(raw)
+        except (binascii.Error, ValueError):
+            return jsonify({'error': 'Invalid base64 image'}), 400
         
-        # Vytvoření dočasné složky
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Uložení obrázku
-            input_path = os.path.join(temp_dir, 'input.jpg')
-            with open(input_path, 'wb') as f:
-                f.write(image_data)
-            
-            # Vytvoření výstupní cesty
-            output_path = os.path.join(temp_dir, 'output.jpg')
-            
-            # Zpracování
-            processor_config = get_processor_config(custom_config)
-            processor = UniversalProcessor(processor_config)
-            
-            success = processor.process_image(Path(input_path))
-            
-            if not success:
-                return jsonify({'error': 'Failed to process image'}), 500
-            
-            # Přečtení výsledku a konverze na base64
-            with open(output_path, 'rb') as f:
-                processed_data = f.read()
-            
-            processed_base64 = base64.b64encode(processed_data).decode('utf-8')
-            
-            return jsonify({
-                'success': True,
-                'processed_image': processed_base64,
-                'format': 'image/jpeg'
-            })
+        # Získání a ověření konfigurace
+        try:
+            processor_config = build_processor_config(data.get('config'))
+        except CONFIG_ERRORS as e:
+            return jsonify({'error': f'Invalid config: {e}'}), 400
+        
+        # Zpracování v paměti (bez zápisu na disk)
+        processor = get_shared_processor(processor_config)
+        
+        future = submit_in_memory(processor, image_data)
+        try:
+            processed_data = future.result(timeout=BASE64_RESULT_TIMEOUT)
+        except FutureTimeoutError:
+            # Úloha, která ve frontě poolu ještě nezačala, se zahodí - výsledek už nikdo nečeká
+            future.cancel()
+            logger.error("❌ Zpracování base64 obrázku nedoběhlo do %d s", BASE64_RESULT_TIMEOUT)
+            return jsonify({'error': f'Processing timed out after {BASE64_RESULT_TIMEOUT} s'}), 504
+        
+        if processed_data is None:
+            return jsonify({'error': 'Failed to process image'}), 500
+        
+        # Konverze výsledku z paměti na base64
+        processed_base64 = base64.b64encode(processed_data).decode('ascii')
+        _, mimetype = OUTPUT_FORMATS.get(processor.output_format, OUTPUT_FORMATS['jpeg'])
+        
+        return jsonify({
+            'success': True,
+            'processed_image': processed_base64,
+            'format': mimetype
+        })
     
+    except RequestEntityTooLarge:
+        return payload_too_large()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -398,13 +638,15 @@ if __name__ == '__main__':
     print("  - GET  / - Frontend interface")
     print("  - GET  /api/health - Health check")
     print("  - POST /api/process-single - Zpracování jednoho obrázku")
+    print("  - POST /api/process-single-stream - Zpracování jednoho obrázku (raw tělo)")
     print("  - POST /api/process-batch - Zpracování více obrázků")
     print("  - POST /api/process-base64 - Zpracování base64 obrázku")
     print("  - GET  /api/config - Získání konfigurace")
     print("  - POST /api/config - Aktualizace konfigurace")
     
-    # Spustíme Flask server vždy, ale v produkci režimu
-    print("🏭 Spouštím Flask server v produkci režimu...")
+    # Pouze pro lokální vývoj (dev_server.py) - produkce běží přes Gunicorn:
+    #   gunicorn api_server:app  (nastavení v gunicorn.conf.py)
+    print("🧪 Spouštím vývojový Flask server...")
     print(f"🌐 Port: {port}")
     
     # Nastavíme logging pro debugging
@@ -1,23 +1,122 @@
 #!/usr/bin/env python3
 """
 Better PNG to JPG conversion that preserves original background
+
+Optional: `pip install PyTurboJPEG` (+ system libturbojpeg) switches JPEG
+encoding to libjpeg-turbo's SIMD single-pass encoder; falls back to Pillow.
+
+Quality vs. throughput: by default JPEGs are encoded in a single pass with the
+standard Huffman tables. `--optimize` (optimize=True) adds libjpeg's second pass
+to build optimal Huffman tables - typically 2-5 % smaller files for roughly
+40 % more encode time, with identical pixels.
 """
 
+import argparse
+import io
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 from PIL import Image
 from pathlib import Path
+from typing import List, Optional, Tuple
 from tqdm import tqdm
 
-def convert_png_to_jpg_better(input_dir, output_dir, quality=95):
-    """Convert PNG files to JPG preserving original background"""
+# Optional libjpeg-turbo encoder
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB, TJSAMP_420
+    _HAS_TURBOJPEG = True
+except ImportError:
+    _HAS_TURBOJPEG = False
+
+# Per-process codec handle, created once per worker by _init_worker()
+_TJ = None
+
+def _init_worker():
+    """Load long-lived codec handles once per worker process"""
+    global _TJ
+    if _HAS_TURBOJPEG and _TJ is None:
+        try:
+            _TJ = TurboJPEG()  # raises if the shared library is missing
+        except Exception:
+            _TJ = None
+
+def _rgba_to_rgb(img: Image.Image) -> Image.Image:
+    """Alpha-blend an RGBA image onto white in one vectorized NumPy pass"""
+    # Fully opaque alpha (common for screenshots) - just drop the channel, no blend
+    if img.getchannel('A').getextrema()[0] == 255:
+        return img.convert('RGB')
+    arr = np.asarray(img, dtype=np.uint8)  # H,W,4
+    a = arr[..., 3:4].astype(np.uint16)
+    rgb = arr[..., :3].astype(np.uint16)
+    out = ((rgb * a + 255 * (255 - a) + 127) // 255).astype(np.uint8)
+    return Image.fromarray(out, 'RGB')
+
+def _la_to_rgb(img: Image.Image) -> Image.Image:
+    # LA: alpha is dropped, not blended (historical behaviour)
+    return img.convert('RGB')
+
+def _p_to_rgb(img: Image.Image) -> Image.Image:
+    # Palette mode with transparency - blend like RGBA
+    if 'transparency' in img.info:
+        return _rgba_to_rgb(img.convert('RGBA'))
+    return img.convert('RGB')
+
+def _identity(img: Image.Image) -> Image.Image:
+    return img
+
+def _default_to_rgb(img: Image.Image) -> Image.Image:
+    return img.convert('RGB')
+
+# PNG mode -> RGB conversion, resolved once per file with a single dict lookup
+_MODE_HANDLERS = {
+    'RGBA': _rgba_to_rgb,
+    'LA': _la_to_rgb,
+    'P': _p_to_rgb,
+    'RGB': _identity,
+}
+
+def _convert_one(png_file: Path, output_path: Path, quality: int, optimize: bool = False) -> Tuple[bool, str]:
+    """Convert a single PNG to JPG (runs in a worker process)"""
+    try:
+        # Open PNG image
+        with Image.open(png_file) as img:
+            # Convert to RGB; transparency is blended onto a white background
+            img = _MODE_HANDLERS.get(img.mode, _default_to_rgb)(img)
+            
+            # Create output filename
+            jpg_file = output_path / (png_file.stem + '.jpg')
+            
+            # Encode in memory, then write the whole file with a single unbuffered write
+            if _TJ is not None and not optimize:
+                # Single-pass SIMD encode, same 4:2:0 subsampling as Pillow's default
+                data = _TJ.encode(np.asarray(img), quality=quality,
+                                  pixel_format=TJPF_RGB, jpeg_subsample=TJSAMP_420)
+            else:
+                buf = io.BytesIO()
+                img.save(buf, 'JPEG', quality=quality, optimize=optimize)
+                data = buf.getvalue()
+            with open(jpg_file, 'wb', buffering=0) as f:
+                f.write(data)
+            
+        return True, str(jpg_file)
+    
+    except Exception as e:
+        return False, f"Error converting {png_file}: {e}"
+
+def convert_png_to_jpg_better(input_dir, output_dir, quality=95, files: Optional[List[Path]] = None, optimize: bool = False):
+    """Convert PNG files to JPG preserving original background
+    
+    Files are converted in parallel, one process per CPU core. If `files` is
+    given, only those files are converted instead of scanning `input_dir`.
+    """
     
     input_path = Path(input_dir)
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
     
     # Find all PNG files
-    png_files = list(input_path.rglob("*.png"))
+    png_files = [Path(f) for f in files] if files is not None else list(input_path.rglob("*.png"))
     print(f"🔍 Found {len(png_files)} PNG files to convert")
     
     if not png_files:
@@ -27,53 +126,25 @@ def convert_png_to_jpg_better(input_dir, output_dir, quality=95):
     converted_count = 0
     error_count = 0
     
-    for png_file in tqdm(png_files, desc="Converting PNG to JPG"):
-        try:
-            # Open PNG image
-            with Image.open(png_file) as img:
-                # Get original mode
-                original_mode = img.mode
-                
-                if original_mode in ('RGBA', 'LA'):
-                    # For RGBA/LA, we need to handle transparency properly
-                    if original_mode == 'RGBA':
-                        # Create a new image with the same size
-                        # Use the alpha channel to blend with a white background
-                        background = Image.new('RGB', img.size, (255, 255, 255))
-                        background.paste(img, mask=img.split()[-1])
-                        img = background
-                    else:  # LA mode
-                        # Convert LA to RGB
-                        img = img.convert('RGB')
-                elif original_mode == 'P':
-                    # Palette mode with transparency
-                    if 'transparency' in img.info:
-                        img = img.convert('RGBA')
-                        background = Image.new('RGB', img.size, (255, 255, 255))
-                        background.paste(img, mask=img.split()[-1])
-                        img = background
-                    else:
-                        img = img.convert('RGB')
-                elif original_mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # Create output filename
-                jpg_file = output_path / (png_file.stem + '.jpg')
-                
-                # Save as JPG
-                img.save(jpg_file, 'JPEG', quality=quality, optimize=True)
-                
+    with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=_init_worker) as executor:
+        futures = [executor.submit(_convert_one, png_file, output_path, quality, optimize) for png_file in png_files]
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Converting PNG to JPG"):
+            ok, message = future.result()
+            if ok:
                 converted_count += 1
-                
-        except Exception as e:
-            print(f"❌ Error converting {png_file}: {e}")
-            error_count += 1
+            else:
+                print(f"❌ {message}")
+                error_count += 1
     
     print(f"\n✅ Conversion complete!")
     print(f"📊 Converted: {converted_count}")
     print(f"❌ Errors: {error_count}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Better PNG to JPG Converter")
+    parser.add_argument("--optimize", action="store_true", help="Optimal Huffman tables (smaller files, slower encode)")
+    args = parser.parse_args()
+    
     # Convert the 20 selected files
     selected_files = [
         "processed_grizly/Full_prevest_png/Cptml100.png",
@@ -104,39 +175,19 @@ if __name__ == "__main__":
     print(f"📁 Output directory: processed_grizly/test_conversion")
     
     # Convert selected files
-    for png_file in tqdm(selected_files, desc="Converting selected files"):
-        try:
-            png_path = Path(png_file)
-            if not png_path.exists():
-                print(f"❌ File not found: {png_file}")
-                continue
-                
-            with Image.open(png_path) as img:
-                original_mode = img.mode
-                
-                if original_mode in ('RGBA', 'LA'):
-                    if original_mode == 'RGBA':
-                        background = Image.new('RGB', img.size, (255, 255, 255))
-                        background.paste(img, mask=img.split()[-1])
-                        img = background
-                    else:
-                        img = img.convert('RGB')
-                elif original_mode == 'P':
-                    if 'transparency' in img.info:
-                        img = img.convert('RGBA')
-                        background = Image.new('RGB', img.size, (255, 255, 255))
-                        background.paste(img, mask=img.split()[-1])
-                        img = background
-                    else:
-                        img = img.convert('RGB')
-                elif original_mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                jpg_file = Path("processed_grizly/test_conversion") / (png_path.stem + '.jpg')
-                img.save(jpg_file, 'JPEG', quality=95, optimize=True)
-                
-        except Exception as e:
-            print(f"❌ Error converting {png_file}: {e}")
+    existing_files = []
+    for png_file in selected_files:
+        png_path = Path(png_file)
+        if not png_path.exists():
+            print(f"❌ File not found: {png_file}")
+            continue
+        existing_files.append(png_path)
     
-    print(f"\n✅ Conversion complete!")
+    convert_png_to_jpg_better(
+        "processed_grizly/Full_prevest_png",
+        "processed_grizly/test_conversion",
+        quality=95,
+        files=existing_files,
+        optimize=args.optimize
+    )
     print(f"📁 Check results in: processed_grizly/test_conversion")
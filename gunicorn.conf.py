@@ -0,0 +1,22 @@
+"""
+Gunicorn konfigurace pro Universal Image Processor API
+Načítá se automaticky při spuštění `gunicorn api_server:app` z kořene projektu.
+
+Ladění:
+- WEB_CONCURRENCY: počet worker procesů (výchozí = počet CPU). Zpracování obrázků
+  je CPU-bound, víc procesů než jader jen přidává kontext switching a RAM.
+- GUNICORN_THREADS: vlákna na worker (výchozí 4). Překrývají I/O (upload,
+  file.save, send_file), Pillow/NumPy během výpočtu uvolňují GIL.
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+# Velké obrázky + rembg mohou trvat déle než výchozích 30 s
+timeout = 120
+accesslog = '-'
+errorlog = '-'
@@ -17,81 +17,168 @@ Usage (example):
     --threads 2:4:2 --tile-size 0
 
 Notes:
-- OpenCV (cv2) is optional. If not available, the script falls back to size-only heuristic.
+- Numba is optional. If available, the Laplacian sharpness metric runs as a JIT-compiled
+  stencil; otherwise a vectorized NumPy version is used (same values as cv2.Laplacian ksize=3).
+- imagesize is optional. If available, dimensions are read from the file header only.
+- CuPy is optional. With --gpu the Laplacian + variance reduction run on the GPU
+  (decode stays on the CPU thread pool).
 - Upscayl CLI can be either 'upscayl-ncnn' (long flags) or the macOS app's 'upscayl-bin' (short flags).
 """
 
 import argparse
+import functools
 import json
 import os
 import shutil
 import subprocess
+import tempfile
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 
 import numpy as np
 from PIL import Image
 from tqdm import tqdm
 
 try:
-    import cv2  # type: ignore
-    HAS_CV2 = True
+    import numba  # type: ignore
+    HAS_NUMBA = True
 except Exception:
-    HAS_CV2 = False
+    HAS_NUMBA = False
+
+try:
+    import imagesize  # type: ignore
+    HAS_IMAGESIZE = True
+except Exception:
+    HAS_IMAGESIZE = False
+
+try:
+    import cupy as cp  # type: ignore
+    HAS_CUPY = True
+except Exception:
+    HAS_CUPY = False
 
 IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".webp"}
 
 
 def list_images(root: Path) -> List[Path]:
+    # os.scandir reuses the stat data from the directory listing; Path objects
+    # are only built for matches. Like rglob, symlinked dirs are not descended
+    # into, symlinked files are kept.
     files: List[Path] = []
-    for p in root.rglob("*"):
-        if p.is_file() and p.suffix.lower() in IMAGE_EXTS:
-            files.append(p)
+    stack = [str(root)]
+    while stack:
+        d = stack.pop()
+        with os.scandir(d) as it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    stack.append(e.path)
+                elif e.is_file():
+                    name = e.name
+                    dot = name.rfind(".")
+                    if dot >= 0 and name[dot:].lower() in IMAGE_EXTS:
+                        files.append(Path(e.path))
     return sorted(files)
 
 
-def variance_of_laplacian(pil_img: Image.Image) -> Optional[float]:
-    if not HAS_CV2:
-        return None
+# Laplacian kernel matching cv2.Laplacian(ksize=3), which the thresholds were tuned on:
+#   [[2, 0, 2], [0, -8, 0], [2, 0, 2]]
+# Input is padded with BORDER_REFLECT_101 (np.pad mode="reflect") like OpenCV.
+# Serial + nogil: images are scanned from a thread pool, and Numba's default
+# parallel (workqueue) layer must not be entered from several threads at once.
+if HAS_NUMBA:
+    @numba.njit(nogil=True, fastmath=True, cache=True)
+    def _lap_var_padded(g):
+        H, W = g.shape
+        s = 0.0
+        s2 = 0.0
+        for y in range(1, H - 1):
+            for x in range(1, W - 1):
+                v = 2 * (g[y - 1, x - 1] + g[y - 1, x + 1] + g[y + 1, x - 1] + g[y + 1, x + 1]) - 8 * g[y, x]
+                s += v
+                s2 += v * v
+        n = (H - 2) * (W - 2)
+        m = s / n
+        return s2 / n - m * m
+else:
+    def _lap_var_padded(g):
+        v = 2 * (g[:-2, :-2] + g[:-2, 2:] + g[2:, :-2] + g[2:, 2:]) - 8 * g[1:-1, 1:-1]
+        return float(v.var())
+
+
+def _lap_var_gpu(padded: np.ndarray) -> float:
+    # Same kernel as _lap_var_padded, evaluated as one fused elementwise pass + reduction on device
+    g = cp.asarray(padded)
+    v = 2 * (g[:-2, :-2] + g[:-2, 2:] + g[2:, :-2] + g[2:, 2:]) - 8 * g[1:-1, 1:-1]
+    return float(v.var())
+
+
+def variance_of_laplacian(pil_img: Image.Image, use_gpu: bool = False) -> Optional[float]:
     try:
-        gray = np.array(pil_img.convert("L"))
-        lap = cv2.Laplacian(gray, cv2.CV_64F, ksize=3)
-        return float(lap.var())
+        gray = np.asarray(pil_img.convert("L"), dtype=np.int32)
+        padded = np.pad(gray, 1, mode="reflect") if min(gray.shape) > 1 else np.pad(gray, 1, mode="edge")
+        if use_gpu:
+            return _lap_var_gpu(padded)
+        return float(_lap_var_padded(padded))
     except Exception:
         return None
 
 
-def compute_metrics(img_path: Path) -> Dict:
+def read_size(img_path: Path) -> Tuple[int, int]:
+    # imagesize parses only the first header bytes; (-1, -1) means unsupported format
+    if HAS_IMAGESIZE:
+        try:
+            width, height = imagesize.get(str(img_path))
+            if width > 0 and height > 0:
+                return width, height
+        except Exception:
+            pass
     with Image.open(img_path) as im:
-        width, height = im.size
-        vol = variance_of_laplacian(im)
-        return {
-            "width": width,
-            "height": height,
-            "min_dim": min(width, height),
-            "laplacian_var": vol,
-        }
+        return im.size
+
+
+def compute_metrics(img_path: Path, size_thresh: int = 0, use_gpu: bool = False, draft_size: int = 0) -> Dict:
+    width, height = read_size(img_path)
+    # Images below the size threshold are selected regardless of sharpness,
+    # so skip opening/decoding them for the Laplacian
+    vol = None
+    if min(width, height) >= size_thresh:
+        with Image.open(img_path) as im:
+            if draft_size and im.format == "JPEG":
+                # libjpeg DCT-domain 1/2..1/8 downscale while decoding (grayscale, fewer IDCTs)
+                im.draft("L", (draft_size, draft_size))
+            vol = variance_of_laplacian(im, use_gpu)
+    return {
+        "width": width,
+        "height": height,
+        "min_dim": min(width, height),
+        "laplacian_var": vol,
+    }
 
 
-def decide_candidate(metrics: Dict, min_dim_thresh: int, lap_thresh: Optional[float]) -> bool:
+def _scan_one(p: Path, size_thresh: int = 0, use_gpu: bool = False, draft_size: int = 0) -> Tuple[Path, Optional[Dict], Optional[str]]:
+    try:
+        return p, compute_metrics(p, size_thresh, use_gpu, draft_size), None
+    except Exception as e:
+        return p, None, str(e)
+
+
+def _make_predicate(min_dim_thresh: int, lap_thresh: Optional[float]) -> Callable[[np.ndarray, np.ndarray], np.ndarray]:
+    """Build the candidate selector once per run, specialized on whether a Laplacian threshold is set"""
     # Always select low-quality images for AI enhancement
-    if metrics["min_dim"] < min_dim_thresh:
-        return True
-    if lap_thresh is not None and metrics.get("laplacian_var") is not None:
-        return metrics["laplacian_var"] < lap_thresh
-    return False
+    if lap_thresh is None:
+        return lambda min_dim, lap: min_dim < min_dim_thresh
+    # NaN (no Laplacian measured) compares False
+    return lambda min_dim, lap: (min_dim < min_dim_thresh) | (lap < lap_thresh)
 
 
-def get_smart_scale(metrics: Dict) -> int:
+def get_smart_scales(min_dim: np.ndarray, selected: np.ndarray) -> np.ndarray:
     """Determine scale based on image dimensions:
     - >= 500x500: scale 1 (AI enhancement only)
     - < 500x500: scale 2 (AI enhancement + 2x upscale)
+    - not selected: 0
     """
-    if metrics["min_dim"] >= 500:
-        return 1  # AI enhancement only
-    else:
-        return 2  # AI enhancement + 2x upscale
+    return np.where(selected, np.where(min_dim >= 500, 1, 2), 0).astype(np.int8)
 
 
 def ensure_dir(path: Path) -> None:
@@ -137,6 +224,83 @@ def upscale_with_upscayl(upscayl_bin: str, model_path: Optional[str], in_path: P
         return False, str(e)
 
 
+def upscale_group(upscayl_bin: str, model_path: Optional[str], items: List[Tuple[Path, Path]], model: str, scale: int, output_format: str, extra_args: List[str]) -> List[Tuple[Path, bool, str, Path]]:
+    """Upscale several files with one CLI invocation (one process start + model load).
+
+    items are (in_path, out_path) pairs that share the same output directory. Inputs are
+    staged into a temp dir next to the outputs; a file counts as done when the CLI
+    produced an output with the same stem.
+    """
+    out_dir = items[0][1].parent
+    ensure_dir(out_dir)
+    stage = Path(tempfile.mkdtemp(prefix=".upscayl-", dir=out_dir))
+    try:
+        stage_in = stage / "in"
+        stage_out = stage / "out"
+        ensure_dir(stage_in)
+        ensure_dir(stage_out)
+        for in_path, _ in items:
+            staged = stage_in / in_path.name
+            try:
+                os.symlink(in_path.resolve(), staged)
+            except OSError:
+                shutil.copy2(in_path, staged)
+
+        _, msg = upscale_with_upscayl(upscayl_bin, model_path, stage_in, stage_out, model, scale, output_format, extra_args)
+
+        produced = {}
+        with os.scandir(stage_out) as it:
+            for e in it:
+                if e.is_file():
+                    produced[os.path.splitext(e.name)[0]] = Path(e.path)
+        results: List[Tuple[Path, bool, str, Path]] = []
+        for in_path, out_path in items:
+            src = produced.get(in_path.stem)
+            if src is None:
+                results.append((in_path, False, msg or "no output produced", out_path))
+                continue
+            # Builds without a format flag keep their own extension - keep it (merge step checks .jpg/.png)
+            final = out_path.with_suffix(src.suffix)
+            try:
+                os.replace(src, final)
+            except OSError as e:
+                results.append((in_path, False, f"could not move output: {e}", out_path))
+                continue
+            results.append((in_path, True, msg, final))
+        return results
+    finally:
+        shutil.rmtree(stage, ignore_errors=True)
+
+
+def _link_one(of: Path, original_root: Path, upscaled_root: Path, merged_root: Path) -> str:
+    rel = of.relative_to(original_root)
+    up = (upscaled_root / rel).with_suffix(".png") if of.suffix.lower() == ".png" else (upscaled_root / rel)
+    target = None
+    if up.exists():
+        target = up
+    else:
+        alt1 = up.with_suffix(".jpg")
+        alt2 = up.with_suffix(".png")
+        if alt1.exists():
+            target = alt1
+        elif alt2.exists():
+            target = alt2
+    link_src = target if target is not None else of
+    link_dst = merged_root / rel
+    if link_dst.exists() or link_dst.is_symlink():
+        link_dst.unlink()
+    # Hardlink first (same filesystem: no copy, no extra symlink hop on read),
+    # then symlink, then a full copy as the last resort
+    try:
+        os.link(link_src, link_dst)
+    except OSError:
+        try:
+            os.symlink(link_src, link_dst)
+        except OSError:
+            shutil.copy2(link_src, link_dst)
+    return "up" if target is not None else "orig"
+
+
 def build_merged_input(original_root: Path, upscaled_root: Path, merged_root: Path) -> Dict[str, int]:
     stats = {"linked_upscaled": 0, "linked_original": 0}
     if merged_root.exists():
@@ -144,33 +308,15 @@ def build_merged_input(original_root: Path, upscaled_root: Path, merged_root: Pa
     ensure_dir(merged_root)
 
     orig_files = list_images(original_root)
-    for of in tqdm(orig_files, desc="Building merged input"):
-        rel = of.relative_to(original_root)
-        up = (upscaled_root / rel).with_suffix(".png") if of.suffix.lower() == ".png" else (upscaled_root / rel)
-        target = None
-        if up.exists():
-            target = up
-        else:
-            alt1 = up.with_suffix(".jpg")
-            alt2 = up.with_suffix(".png")
-            if alt1.exists():
-                target = alt1
-            elif alt2.exists():
-                target = alt2
-        link_src = target if target is not None else of
-        link_dst = merged_root / rel
-        ensure_dir(link_dst.parent)
-        try:
-            if link_dst.exists() or link_dst.is_symlink():
-                link_dst.unlink()
-            os.symlink(link_src, link_dst)
-            if target is not None:
-                stats["linked_upscaled"] += 1
-            else:
-                stats["linked_original"] += 1
-        except OSError:
-            shutil.copy2(link_src, link_dst)
-            if target is not None:
+    # Create the directory tree up front so worker threads never race on mkdir
+    for d in sorted({(merged_root / of.relative_to(original_root)).parent for of in orig_files}):
+        ensure_dir(d)
+
+    link = functools.partial(_link_one, original_root=original_root, upscaled_root=upscaled_root, merged_root=merged_root)
+    # Pure syscall work (stat/link/unlink) - threads overlap the round-trips, capped at 32
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 2)) as ex:
+        for kind in tqdm(ex.map(link, orig_files), total=len(orig_files), desc="Building merged input"):
+            if kind == "up":
                 stats["linked_upscaled"] += 1
             else:
                 stats["linked_original"] += 1
@@ -193,9 +339,16 @@ def main() -> None:
     parser.add_argument("--output-format", default="jpg", choices=["jpg", "png", "webp"], help="Output image format for upscaled files")
     parser.add_argument("--dry-run", action="store_true", help="Only generate report, do not call Upscayl")
     parser.add_argument("--merged-input", default="", help="Optional: build merged input dir that prefers upscaled files")
+    parser.add_argument("--gpu", action="store_true", help="Compute Laplacian variance on the GPU (requires CuPy)")
+    parser.add_argument("--draft-size", type=int, default=0, help="JPEG only: measure sharpness on a reduced decode of at least this size (0 = full resolution; values differ from full-res, retune --laplacian-thresh)")
 
     args = parser.parse_args()
 
+    is_candidate = _make_predicate(args.min_dim, args.laplacian_thresh)
+    use_gpu = args.gpu and HAS_CUPY
+    if args.gpu and not HAS_CUPY:
+        print("Warning: --gpu requested but CuPy is not installed, computing Laplacian on the CPU.")
+
     input_root = Path(args.input)
     out_root = Path(args.output_upscaled)
     ensure_dir(out_root)
@@ -215,7 +368,10 @@ def main() -> None:
             "min_dim": args.min_dim,
             "laplacian_thresh": args.laplacian_thresh,
             "upscayl_bin": args.upscayl_bin,
-            "has_cv2": HAS_CV2,
+            "has_numba": HAS_NUMBA,
+            "has_imagesize": HAS_IMAGESIZE,
+            "gpu": use_gpu,
+            "draft_size": args.draft_size,
             "output_format": args.output_format,
             "limit": args.limit,
         },
@@ -225,28 +381,50 @@ def main() -> None:
         "missing_cli": False,
     }
 
-    candidates: List[Tuple[Path, Dict, int]] = []  # (path, metrics, scale)
-    for p in tqdm(files, desc="Scanning quality"):
-        try:
-            metrics = compute_metrics(p)
-            need = decide_candidate(metrics, args.min_dim, args.laplacian_thresh if HAS_CV2 else None)
-            scale = get_smart_scale(metrics) if need else 0
-            report["items"].append({
-                "path": str(p),
-                "metrics": metrics,
-                "selected": need,
-                "scale": scale,
-            })
-            if need:
-                candidates.append((p, metrics, scale))
-        except Exception as e:
-            report["errors"].append(f"{p}: {e}")
+    # Per-image metrics in flat arrays instead of a dict per file; NaN = no Laplacian
+    n = len(files)
+    widths = np.zeros(n, np.int32)
+    heights = np.zeros(n, np.int32)
+    lap = np.full(n, np.nan, np.float64)
+    scanned = np.zeros(n, bool)
+    # Decode + Laplacian release the GIL (Pillow / NumPy / nogil Numba); map keeps input order
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+        scan = functools.partial(_scan_one, size_thresh=args.min_dim, use_gpu=use_gpu, draft_size=args.draft_size)
+        for i, (p, metrics, err) in enumerate(tqdm(ex.map(scan, files), total=n, desc="Scanning quality")):
+            if err is not None:
+                report["errors"].append(f"{p}: {err}")
+                continue
+            scanned[i] = True
+            widths[i] = metrics["width"]
+            heights[i] = metrics["height"]
+            if metrics["laplacian_var"] is not None:
+                lap[i] = metrics["laplacian_var"]
+
+    # Vectorized selection over all scanned images
+    min_dims = np.minimum(widths, heights)
+    selected = scanned & is_candidate(min_dims, lap)
+    scales = get_smart_scales(min_dims, selected)
+
+    candidates: List[Tuple[Path, int]] = [(files[i], int(scales[i])) for i in np.flatnonzero(selected)]
+    # Report items are only materialized as dicts for the JSON dump
+    for i in np.flatnonzero(scanned):
+        report["items"].append({
+            "path": str(files[i]),
+            "metrics": {
+                "width": int(widths[i]),
+                "height": int(heights[i]),
+                "min_dim": int(min_dims[i]),
+                "laplacian_var": None if np.isnan(lap[i]) else float(lap[i]),
+            },
+            "selected": bool(selected[i]),
+            "scale": int(scales[i]),
+        })
 
     print(f"Candidates for upscale: {len(candidates)}/{len(files)}")
     
     # Group by scale for reporting
-    scale_1_count = sum(1 for _, _, scale in candidates if scale == 1)
-    scale_2_count = sum(1 for _, _, scale in candidates if scale == 2)
+    scale_1_count = int(np.count_nonzero(scales == 1))
+    scale_2_count = int(np.count_nonzero(scales == 2))
     print(f"  - Scale 1 (AI enhancement only): {scale_1_count}")
     print(f"  - Scale 2 (AI enhancement + 2x upscale): {scale_2_count}")
 
@@ -261,23 +439,34 @@ def main() -> None:
     if not args.dry_run and (shutil.which(args.upscayl_bin) or Path(args.upscayl_bin).exists()):
         extra = [s for s in args.extra_args.split(" ") if s]
         
-        # Per-file processing with smart scaling
-        def task(item: Tuple[Path, Dict, int]) -> Tuple[Path, bool, str, Path]:
-            in_path, metrics, scale = item
+        # One CLI call per (scale, output subfolder) group instead of per file.
+        # Outputs are matched back by stem, so files sharing a stem (a.jpg + a.png)
+        # go to separate groups: the n-th occurrence of a stem joins group n.
+        groups: Dict[Tuple[int, Path, int], List[Tuple[Path, Path]]] = {}
+        stem_counts: Dict[Tuple[int, Path, str], int] = {}
+        for in_path, scale in selected_cands:
             rel = in_path.relative_to(input_root)
             out_path = (out_root / rel).with_suffix(f".{args.output_format}")
-            ok, msg = upscale_with_upscayl(upscayl_bin, args.model_path, in_path, out_path, args.model, scale, args.output_format, extra)
-            return (in_path, ok, msg, out_path)
+            stem_key = (scale, rel.parent, in_path.stem)
+            n = stem_counts.get(stem_key, 0)
+            stem_counts[stem_key] = n + 1
+            groups.setdefault((scale, rel.parent, n), []).append((in_path, out_path))
+
+        def task(key: Tuple[int, Path, int]) -> List[Tuple[Path, bool, str, Path]]:
+            scale = key[0]
+            return upscale_group(upscayl_bin, args.model_path, groups[key], args.model, scale, args.output_format, extra)
 
         with ThreadPoolExecutor(max_workers=max(1, args.max_workers)) as ex:
-            futures = [ex.submit(task, it) for it in selected_cands]
-            for fut in tqdm(as_completed(futures), total=len(futures), desc="Smart upscaling"):
-                in_path, ok, msg, out_path = fut.result()
-                if ok:
-                    processed += 1
-                else:
-                    failed += 1
-                    report["errors"].append(f"{in_path}: {msg}")
+            futures = [ex.submit(task, key) for key in groups]
+            with tqdm(total=len(selected_cands), desc="Smart upscaling") as bar:
+                for fut in as_completed(futures):
+                    for in_path, ok, msg, out_path in fut.result():
+                        if ok:
+                            processed += 1
+                        else:
+                            failed += 1
+                            report["errors"].append(f"{in_path}: {msg}")
+                        bar.update(1)
     
     report["summary"] = {
         "candidates": len(candidates),
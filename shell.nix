@@ -5,6 +5,9 @@ pkgs.mkShell {
     python311
     python311Packages.flask
     python311Packages.flask-cors
+    python311Packages.flask-compress
+    python311Packages.whitenoise
+    python311Packages.orjson
     python311Packages.pillow
     python311Packages.tqdm
     python311Packages.numpy
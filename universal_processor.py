@@ -5,11 +5,12 @@ Univerzální řešení pro všechny typy produktových obrázků
 """
 
 import os
-from PIL import Image, ImageFilter
+from PIL import Image, ImageFilter, ImageOps
 from io import BytesIO
 from tqdm import tqdm
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple, Optional, Union, BinaryIO
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import argparse
 import numpy as np
 from collections import deque
@@ -18,13 +19,23 @@ from collections import deque
 # Falls back to pure NumPy implementations if scipy is not available
 try:
     from scipy.ndimage import gaussian_filter as _scipy_gaussian
+    from scipy.ndimage import gaussian_filter1d as _scipy_gaussian1d
     from scipy.ndimage import uniform_filter as _scipy_uniform
     from scipy.ndimage import binary_erosion as _scipy_erode
     from scipy.ndimage import binary_dilation as _scipy_dilate
+    from scipy.ndimage import label as _scipy_label
     _HAS_SCIPY = True
 except ImportError:
     _HAS_SCIPY = False
 
+# Optional numba for fused per-pixel kernels (PNG unmatte)
+# Falls back to vectorized NumPy if numba is not available
+try:
+    import numba as _numba
+    _HAS_NUMBA = True
+except ImportError:
+    _HAS_NUMBA = False
+
 
 def _np_gaussian_blur(arr: np.ndarray, sigma: float = 1.0) -> np.ndarray:
     """Pure NumPy Gaussian-like blur using separable 3x3 approximation kernel.
@@ -95,6 +106,51 @@ def _np_binary_dilation(mask: np.ndarray, iterations: int = 1) -> np.ndarray:
     return result
 
 
+def _np_flood_fill_from_border(seed_mask: np.ndarray) -> np.ndarray:
+    """Pure NumPy/Python BFS flood fill (4-connectivity) from border pixels of seed_mask."""
+    h, w = seed_mask.shape
+    visited = np.zeros((h, w), dtype=bool)
+    q = deque()
+    for x in range(w):
+        if seed_mask[0, x] and not visited[0, x]:
+            visited[0, x] = True; q.append((0, x))
+        if seed_mask[h-1, x] and not visited[h-1, x]:
+            visited[h-1, x] = True; q.append((h-1, x))
+    for y in range(h):
+        if seed_mask[y, 0] and not visited[y, 0]:
+            visited[y, 0] = True; q.append((y, 0))
+        if seed_mask[y, w-1] and not visited[y, w-1]:
+            visited[y, w-1] = True; q.append((y, w-1))
+    while q:
+        y, x = q.popleft()
+        if y+1 < h and not visited[y+1, x] and seed_mask[y+1, x]:
+            visited[y+1, x] = True; q.append((y+1, x))
+        if y-1 >= 0 and not visited[y-1, x] and seed_mask[y-1, x]:
+            visited[y-1, x] = True; q.append((y-1, x))
+        if x+1 < w and not visited[y, x+1] and seed_mask[y, x+1]:
+            visited[y, x+1] = True; q.append((y, x+1))
+        if x-1 >= 0 and not visited[y, x-1] and seed_mask[y, x-1]:
+            visited[y, x-1] = True; q.append((y, x-1))
+    return visited
+
+
+def flood_fill_from_border(seed_mask: np.ndarray) -> np.ndarray:
+    """Flood fill from border: uses scipy connected components if available, otherwise BFS fallback.
+
+    Returns True for every seed pixel 4-connected to the image border."""
+    if _HAS_SCIPY:
+        # Default structure = 4-connectivity, same as the BFS fallback
+        labels, n = _scipy_label(seed_mask)
+        is_border_label = np.zeros(n + 1, dtype=bool)
+        is_border_label[labels[0, :]] = True
+        is_border_label[labels[-1, :]] = True
+        is_border_label[labels[:, 0]] = True
+        is_border_label[labels[:, -1]] = True
+        is_border_label[0] = False
+        return is_border_label[labels]
+    return _np_flood_fill_from_border(seed_mask)
+
+
 def gaussian_blur(arr: np.ndarray, sigma: float = 1.0) -> np.ndarray:
     """Gaussian blur: uses scipy if available, otherwise NumPy fallback."""
     if _HAS_SCIPY:
@@ -124,12 +180,67 @@ def binary_dilation(mask: np.ndarray, iterations: int = 1) -> np.ndarray:
         return _scipy_dilate(mask, structure=structure, iterations=iterations)
     return _np_binary_dilation(mask, iterations=iterations)
 
+
+# Fused unmatte: jeden průchod přes pixely bez float32 mezivýsledků přes celý snímek.
+# Sériově + nogil: API volá procesor z více vláken a paralelní
+# (workqueue) vrstva Numby nesmí být spuštěna z více vláken současně.
+# Bez fastmath a se stejnou celočíselnou vzdáleností od matte jako NumPy fallback,
+# aby výběr pixelů i výsledné hodnoty byly shodné.
+if _HAS_NUMBA:
+    @_numba.njit(nogil=True, cache=True)
+    def _unmatte_kernel(rgba_u8, matte_rgb, matte_u8, fringe_mask, thr2):
+        """Unmatte pixelů z fringe_mask blízkých matte barvě, in-place v rgba_u8. Vrací počet změněných pixelů."""
+        h, w = fringe_mask.shape
+        c255 = np.float32(255.0)
+        eps = np.float32(1e-6)
+        changed = 0
+        for y in range(h):
+            for x in range(w):
+                if not fringe_mask[y, x]:
+                    continue
+                dr = np.int32(rgba_u8[y, x, 0]) - np.int32(matte_u8[0])
+                dg = np.int32(rgba_u8[y, x, 1]) - np.int32(matte_u8[1])
+                db = np.int32(rgba_u8[y, x, 2]) - np.int32(matte_u8[2])
+                if dr * dr + dg * dg + db * db >= thr2:
+                    continue
+                a = rgba_u8[y, x, 3] / c255
+                a_safe = max(a, eps)
+                for c in range(3):
+                    v = (rgba_u8[y, x, c] / c255 - matte_rgb[c] * (np.float32(1.0) - a)) / a_safe
+                    v = min(max(v, np.float32(0.0)), np.float32(1.0))
+                    rgba_u8[y, x, c] = np.uint8(v * c255 + np.float32(0.5))
+                changed += 1
+        return changed
+
+
+def _nearest_source_index(src_size: int, dst_size: int) -> np.ndarray:
+    """Pro každý cílový index vrátí zdrojový index, který vybere Pillow NEAREST resize
+
+    Pillow počítá souřadnice v pevné řádové čárce, jednoduchý vzorec se od něj
+    na hranách o pixel liší - proto se mapování vezme přímo z resize 1xN obrázku.
+    """
+    index_img = Image.fromarray(np.arange(src_size, dtype=np.int32)[None, :])
+    return np.asarray(index_img.resize((dst_size, 1), Image.Resampling.NEAREST))[0]
+
+
+# Výstupní formát -> (přípona souboru, MIME typ)
+OUTPUT_FORMATS = {
+    'webp': ('.webp', 'image/webp'),
+    'png': ('.png', 'image/png'),
+    'jpeg': ('.jpg', 'image/jpeg'),
+}
+
 class UniversalProcessor:
     def __init__(self, config: Dict):
         self.config = config
         self.target_width = config.get('target_width', 400)
         self.target_height = config.get('target_height', 400)
         self.quality = config.get('quality', 98)
+        # Optimalizované Huffmanovy tabulky JPG (~9 % menší soubor, ~2.5x pomalejší enkódování)
+        self.jpeg_optimize = config.get('jpeg_optimize', False)
+        # Chroma subsampling JPG: 2 = 4:2:0 (web, ~40 % rychlejší enkódování, menší soubory),
+        # 0 = 4:4:4 jen pro zdrojové mastery
+        self.jpeg_subsampling = config.get('jpeg_subsampling', 2)
         # Minimální povolená kvalita při adaptivní kompresi
         self.min_quality = config.get('min_quality', 65)
         # Cílová maximální velikost souboru ve kB (pouze pro WEBP, None = vypnuto)
@@ -164,12 +275,25 @@ class UniversalProcessor:
         # Vyšší hodnota = méně bariér (permisivnější fill), nižší = více bariér
         # 0 = vypnuto (legacy chování)
         self.edge_barrier_threshold = config.get('edge_barrier_threshold', 10)
+        # Počet worker procesů pro dávkové zpracování složky (None = počet CPU)
+        self.max_workers = config.get('max_workers', None)
+        
+        # Barvy naparsované jednou (ne při každém obrázku)
+        self._bg_rgb = self._hex_to_rgb(self.background_color)
+        self._matte_rgb = np.array(self._hex_to_rgb(self.png_matte), dtype=np.int32)
+        self._matte_rgb_f32 = self._matte_rgb.astype(np.float32) / 255.0
         
         # Vytvoření složek
         self.input_dir = Path(config.get('input_dir', 'input_images'))
         self.output_dir = Path(config.get('output_dir', 'processed_images'))
         self.output_dir.mkdir(exist_ok=True)
     
+    def set_paths(self, input_dir, output_dir) -> None:
+        """Přenastaví vstupní a výstupní složku bez nové inicializace procesoru"""
+        self.input_dir = Path(input_dir)
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(exist_ok=True)
+    
     def _hex_to_rgb(self, hex_color: str) -> Tuple[int, int, int]:
         h = hex_color.lstrip('#')
         return (int(h[0:2], 16), int(h[2:4], 16), int(h[4:6], 16))
@@ -186,43 +310,36 @@ class UniversalProcessor:
         if img.mode != 'RGBA':
             return img
         
-        arr = np.array(img).astype(np.float32) / 255.0
-        rgb = arr[:, :, :3]
-        a = arr[:, :, 3]
+        rgba = np.array(img)
+        alpha = rgba[:, :, 3]
         
         # Matte barva (typicky bílá)
-        matte = np.array(self._hex_to_rgb(self.png_matte), dtype=np.float32) / 255.0
+        matte_u8 = self._matte_rgb
+        matte = self._matte_rgb_f32
         
-        # Práh pro detekci "neprůhledných" a "průhledných" pixelů
-        opaque_threshold = 0.95
-        transparent_threshold = 0.05
+        # Prahy pro detekci "neprůhledných" a "průhledných" pixelů v uint8 doméně
+        # (ekvivalent a >= 0.95, a <= 0.05 a a < 0.5 nad alfou normalizovanou na 0..1)
+        opaque_threshold = 243
+        transparent_threshold = 12
+        low_alpha_threshold = 127
         
-        # Vytvoř binární masku neprůhledných a průhledných pixelů
-        opaque_mask = a >= opaque_threshold
-        transparent_mask = a <= transparent_threshold
+        # Fringe může být jen na poloprůhledných pixelech - čistě ořezané PNG (alfa jen 0/255) rovnou vrať
+        if not np.any((alpha > transparent_threshold) & (alpha < opaque_threshold)):
+            return img
         
-        # Jednoduchá dilatace pomocí numpy
-        def dilate_mask(mask, iterations=1):
-            result = mask.copy()
-            for _ in range(iterations):
-                padded = np.pad(result, 1, mode='constant', constant_values=False)
-                dilated = (
-                    padded[:-2, :-2] | padded[:-2, 1:-1] | padded[:-2, 2:] |
-                    padded[1:-1, :-2] | padded[1:-1, 1:-1] | padded[1:-1, 2:] |
-                    padded[2:, :-2] | padded[2:, 1:-1] | padded[2:, 2:]
-                )
-                result = dilated
-            return result
+        # Vytvoř binární masku neprůhledných a průhledných pixelů
+        opaque_mask = alpha >= opaque_threshold
+        transparent_mask = alpha <= transparent_threshold
         
         # Dilatuj průhlednou oblast
-        dilated_transparent = dilate_mask(transparent_mask, iterations=2)
+        dilated_transparent = binary_dilation(transparent_mask, iterations=2)
         
         # Okrajové pixely (sousedí s průhledností, nejsou plně neprůhledné/průhledné)
         edge_mask = dilated_transparent & (~opaque_mask) & (~transparent_mask)
         
         # Anti-aliased hrany s nízkou alfou
-        low_alpha_mask = (a < 0.5) & (a > transparent_threshold)
-        dilated_opaque = dilate_mask(opaque_mask, iterations=1)
+        low_alpha_mask = (alpha <= low_alpha_threshold) & (alpha > transparent_threshold)
+        dilated_opaque = binary_dilation(opaque_mask, iterations=1)
         antialiased_edges = low_alpha_mask & dilated_opaque
         
         # Kombinuj obě masky
@@ -232,17 +349,29 @@ class UniversalProcessor:
         if not np.any(potential_fringe_mask):
             return img
         
-        # === KLÍČOVÁ ZMĚNA: Detekce bílého fringe ===
-        # Pixel má bílý fringe pokud je jeho barva blízká matte barvě
-        # Vypočítej vzdálenost od matte barvy
-        rgb_distance = np.sqrt(np.sum((rgb - matte) ** 2, axis=2))
-        
         # Práh pro "blízko matte" - pixel musí být docela světlý
         # Nižší hodnota = přísněji (detekuje jen velmi bílé pixely)
         white_fringe_threshold = 0.35  # Max vzdálenost od bílé
         
+        # Práh jako kvadrát vzdálenosti v uint8 doméně (společný pro Numba i NumPy cestu)
+        fringe_threshold_sq = (white_fringe_threshold * 255.0) ** 2
+        
+        if _HAS_NUMBA:
+            # rgba je vlastní kopie z np.array(img) - zapisuje se přímo do ní
+            changed = _unmatte_kernel(rgba, matte, matte_u8, potential_fringe_mask,
+                                      fringe_threshold_sq)
+            if changed == 0:
+                return img
+            return Image.fromarray(rgba, mode='RGBA')
+        
+        # === KLÍČOVÁ ZMĚNA: Detekce bílého fringe ===
+        # Pixel má bílý fringe pokud je jeho barva blízká matte barvě.
+        # Kvadrát vzdálenosti v celočíselné doméně (max 3*255^2 se vejde do int32)
+        diff = rgba[:, :, :3].astype(np.int32) - matte_u8
+        rgb_distance_sq = np.einsum('ijk,ijk->ij', diff, diff)
+        
         # Pixel má bílý fringe jen pokud je světlý (blízko matte)
-        has_white_fringe = rgb_distance < white_fringe_threshold
+        has_white_fringe = rgb_distance_sq < fringe_threshold_sq
         
         # Finální maska: okrajové pixely které SKUTEČNĚ mají bílý fringe
         final_unmatte_mask = potential_fringe_mask & has_white_fringe
@@ -251,24 +380,25 @@ class UniversalProcessor:
         if not np.any(final_unmatte_mask):
             return img
         
+        # Do floatu převeď jen fringe pixely, unmatte a zapiš zpět maskovaným přiřazením
         eps = 1e-6
-        a_expanded = a[:, :, np.newaxis]
-        
-        # Vypočítej unmatted RGB
-        rgb_unmatted = (rgb - matte * (1.0 - a_expanded)) / np.clip(a_expanded, eps, 1.0)
-        rgb_unmatted = np.clip(rgb_unmatted, 0.0, 1.0)
-        
-        # Aplikuj unmatte POUZE na pixely s bílým fringe
-        final_unmatte_mask_3d = final_unmatte_mask[:, :, np.newaxis]
-        rgb_result = np.where(final_unmatte_mask_3d, rgb_unmatted, rgb)
-        
-        # Sestav výstup
-        out = np.concatenate([rgb_result, a[:, :, np.newaxis]], axis=2)
-        out = (out * 255.0 + 0.5).astype(np.uint8)
-        return Image.fromarray(out, mode='RGBA')
+        # (jeden float32 buffer upravovaný in-place, zápis rovnou do uint8 RGBA)
+        rgb_sel = rgba[final_unmatte_mask, :3].astype(np.float32)
+        rgb_sel /= 255.0
+        a_sel = alpha[final_unmatte_mask].astype(np.float32)[:, np.newaxis]
+        a_sel /= 255.0
+        rgb_sel -= matte * (1.0 - a_sel)
+        rgb_sel /= np.clip(a_sel, eps, 1.0)
+        np.clip(rgb_sel, 0.0, 1.0, out=rgb_sel)
+        rgb_sel *= 255.0
+        rgb_sel += 0.5
+        rgba[final_unmatte_mask, :3] = rgb_sel
+        return Image.fromarray(rgba, mode='RGBA')
     
     def _compute_background_mask_rgb(self, img: Image.Image) -> np.ndarray:
-        """Rychlé flood-fill pozadí: vyhodnotí bělavost/černost na downscalované verzi a výsledek upscaluje.
+        """Rychlé flood-fill pozadí: vyhodnotí bělavost/černost na downscalované verzi (max 256 px).
+
+        Maska se vrací ve zmenšeném rozlišení, měřítko vůči obrázku plyne z jejího tvaru.
 
         - Pokud je `background_edge_mode` 'white', bere se jako pozadí světlá oblast.
         - Pokud je 'black', bere se jako pozadí tmavá oblast.
@@ -283,50 +413,56 @@ class UniversalProcessor:
             scale = max_dim / float(max(orig_w, orig_h))
             small_w = max(1, int(round(orig_w * scale)))
             small_h = max(1, int(round(orig_h * scale)))
-            work_img = img.resize((small_w, small_h), Image.Resampling.BILINEAR)
+            # reducing_gap: nejdřív rychlé celočíselné blokové průměrování (Image.reduce),
+            # BILINEAR pak dorovná jen zbytek - výstupní velikost zůstává stejná
+            work_img = img.resize((small_w, small_h), Image.Resampling.BILINEAR, reducing_gap=2.0)
         else:
             small_w, small_h = orig_w, orig_h
             work_img = img
         arr = np.array(work_img)
         # Použijeme průměrný jas (luminanci) pro robustnější detekci "špinavé" bílé/černé
         # (řeší barevný nádech stínů, např. do modra/žluta)
-        mean_brightness = np.mean(arr[:, :, :3], axis=2)
+        # Celočíselný součet kanálů (= 3x průměrný jas, max 765 se vejde do uint16);
+        # prahy na jas se porovnávají vynásobené třemi
+        sum3 = arr[:, :, :3].sum(axis=2, dtype=np.uint16)
         
         # Dynamický výpočet prahu podle rohů obrázku (pokud je pozadí tmavší než default threshold)
         # Získáme průměrný jas rohů (předpokládáme že rohy jsou pozadí)
-        tl = mean_brightness[0:10, 0:10].mean()
-        tr = mean_brightness[0:10, -10:].mean()
-        bl = mean_brightness[-10:, 0:10].mean()
-        br = mean_brightness[-10:, -10:].mean()
-        corners_mean = np.mean([tl, tr, bl, br])
+        # (počítá se v doméně součtu, aby shody na hraně prahu nezávisely na zaokrouhlení dělení)
+        tl = sum3[0:10, 0:10].mean()
+        tr = sum3[0:10, -10:].mean()
+        bl = sum3[-10:, 0:10].mean()
+        br = sum3[-10:, -10:].mean()
+        corners_sum = np.mean([tl, tr, bl, br])
+        corners_mean = corners_sum / 3.0
         
         # Pokud je pozadí "bílé" (jas > 100), ale tmavší než default threshold (např. 180),
         # snížíme práh dynamicky, aby zachytil toto pozadí.
         # Nechceme jít příliš nízko (pod 150), abychom neřízli do produktu.
-        effective_white_threshold = self.white_threshold
+        effective_white_threshold = 3 * self.white_threshold
         if corners_mean > 100: # Je to spíše světlé pozadí
              # Nastavíme threshold kousek pod jas pozadí (tolerance 10-15)
-             dynamic_threshold = max(150, corners_mean - 15)
+             dynamic_threshold = max(3 * 150, corners_sum - 3 * 15)
              # Použijeme ten nižší (buď default nebo dynamický), ale ne vyšší než default
              # (aby user mohl threshold manuálně snížit, pokud chce)
              # Zde chceme povolit POKLES pod 190, pokud je fotka tmavá.
              # Ale default 190 může být moc vysoko pro tmavou fotku (kde pozadí je 160).
              # Takže effective = min(default, dynamic)
-             effective_white_threshold = min(self.white_threshold, dynamic_threshold)
+             effective_white_threshold = min(3 * self.white_threshold, dynamic_threshold)
              # Ale zároveň, pokud je fotka PERFEKTNÍ (pozadí 255), dynamic bude 240.
              # Pokud user nastavil 190, tak min(190, 240) = 190. To je OK (190 zachytí 255).
              # Problém je, když pozadí je 180. Dynamic = 165. Min(190, 165) = 165.
              # Tím pádem 165 zachytí 180. Bingo!
         
-        white_like = mean_brightness >= effective_white_threshold
-        black_like = mean_brightness <= self.black_threshold
+        white_like = sum3 >= effective_white_threshold
+        black_like = sum3 <= 3 * self.black_threshold
 
         # --- Edge barrier for flood fill ---
         # Gradient-based barrier prevents flood-fill from bleeding into white
         # products that share brightness with the background.
         if self.edge_barrier_threshold > 0:
             # Pre-smooth brightness to reduce noise on uniform backgrounds
-            smoothed_brightness = gaussian_blur(mean_brightness.astype(np.float64), sigma=1.0)
+            smoothed_brightness = gaussian_blur(sum3 / 3.0, sigma=1.0)
 
             # Gradient barrier (on smoothed brightness for cleaner edges)
             padded = np.pad(smoothed_brightness, 1, mode='edge')
@@ -337,22 +473,6 @@ class UniversalProcessor:
             white_like = white_like & ~is_edge_barrier
             black_like = black_like & ~is_edge_barrier
 
-        h, w = white_like.shape
-        visited = np.zeros((h, w), dtype=bool)
-        q = deque()
-
-        def enqueue_edge_seeds(mask: np.ndarray):
-            for x in range(w):
-                if mask[0, x] and not visited[0, x]:
-                    visited[0, x] = True; q.append((0, x))
-                if mask[h-1, x] and not visited[h-1, x]:
-                    visited[h-1, x] = True; q.append((h-1, x))
-            for y in range(h):
-                if mask[y, 0] and not visited[y, 0]:
-                    visited[y, 0] = True; q.append((y, 0))
-                if mask[y, w-1] and not visited[y, w-1]:
-                    visited[y, w-1] = True; q.append((y, w-1))
-
         # Zvol seed masku podle režimu
         if self.background_edge_mode == 'white':
             seed_mask = white_like
@@ -366,65 +486,67 @@ class UniversalProcessor:
                               black_like[:, 0].sum() + black_like[:, -1].sum())
             seed_mask = white_like if white_count >= black_count else black_like
 
-        enqueue_edge_seeds(seed_mask)
-        while q:
-            y, x = q.popleft()
-            if y+1 < h and not visited[y+1, x] and seed_mask[y+1, x]:
-                visited[y+1, x] = True; q.append((y+1, x))
-            if y-1 >= 0 and not visited[y-1, x] and seed_mask[y-1, x]:
-                visited[y-1, x] = True; q.append((y-1, x))
-            if x+1 < w and not visited[y, x+1] and seed_mask[y, x+1]:
-                visited[y, x+1] = True; q.append((y, x+1))
-            if x-1 >= 0 and not visited[y, x-1] and seed_mask[y, x-1]:
-                visited[y, x-1] = True; q.append((y, x-1))
-
-        visited_img = Image.fromarray((visited.astype(np.uint8) * 255))
-        up_mask = visited_img.resize((orig_w, orig_h), Image.Resampling.NEAREST)
-        return np.array(up_mask) > 0
+        return flood_fill_from_border(seed_mask)
     
     def _compute_product_mask(self, img: Image.Image) -> np.ndarray:
-        """Vrátí boolean masku produktu z RGBA alfy nebo flood-fill z RGB."""
+        """Vrátí boolean masku produktu z RGBA alfy nebo flood-fill z RGB.
+
+        Flood-fill maska je ve zmenšeném rozlišení (viz `_compute_background_mask_rgb`).
+        """
         if 'A' in img.getbands():
-            rgba = img.convert('RGBA')
-            arr = np.array(rgba)
-            alpha = arr[:, :, 3]
+            # Jen alfa kanál - bez kopie celého RGBA do numpy
+            alpha = np.asarray(img.getchannel('A'))
             return alpha > self.alpha_threshold
         else:
             background_mask = self._compute_background_mask_rgb(img)
             return ~background_mask
     
-    def find_product_bbox(self, img: Image.Image) -> Optional[Tuple[int, int, int, int]]:
-        """Najde bounding box produktu s vylepšenou detekcí (alfa nebo bílá)"""
+    def _find_product_bbox_and_mask(self, img: Image.Image) -> Tuple[Optional[Tuple[int, int, int, int]], Optional[np.ndarray]]:
+        """Najde bounding box produktu a vrátí ho spolu s maskou produktu celého obrázku"""
         try:
             product_mask = self._compute_product_mask(img)
             if not np.any(product_mask):
-                return None
+                return None, product_mask
             rows = np.any(product_mask, axis=1)
             cols = np.any(product_mask, axis=0)
-            y1, y2 = np.where(rows)[0][[0, -1]]
-            x1, x2 = np.where(cols)[0][[0, -1]]
+            # První/poslední True přes argmax bez alokace pole indexů
+            y1 = int(rows.argmax())
+            y2 = len(rows) - 1 - int(rows[::-1].argmax())
+            x1 = int(cols.argmax())
+            x2 = len(cols) - 1 - int(cols[::-1].argmax())
+            mask_h, mask_w = product_mask.shape
+            if (mask_w, mask_h) != img.size:
+                # Zmenšená maska -> přesně ty pixely plného rozlišení, které by pokryl
+                # NEAREST upsample v Pillow (stejné mapování indexů jako resize)
+                src_x = _nearest_source_index(mask_w, img.size[0])
+                src_y = _nearest_source_index(mask_h, img.size[1])
+                x1 = int(np.searchsorted(src_x, x1, side='left'))
+                x2 = int(np.searchsorted(src_x, x2, side='right')) - 1
+                y1 = int(np.searchsorted(src_y, y1, side='left'))
+                y2 = int(np.searchsorted(src_y, y2, side='right')) - 1
             padding = 10
             x1 = max(0, x1 - padding)
             y1 = max(0, y1 - padding)
             x2 = min(img.size[0], x2 + padding)
             y2 = min(img.size[1], y2 + padding)
-            return (x1, y1, x2, y2)
+            return (x1, y1, x2, y2), product_mask
         except Exception as e:
             print(f"Chyba při hledání bounding box: {e}")
-            return None
+            return None, None
+    
+    def find_product_bbox(self, img: Image.Image) -> Optional[Tuple[int, int, int, int]]:
+        """Najde bounding box produktu s vylepšenou detekcí (alfa nebo bílá)"""
+        bbox, _ = self._find_product_bbox_and_mask(img)
+        return bbox
     
     def smart_resize_and_center(self, img: Image.Image) -> Image.Image:
         """Chytře změní velikost a vycentruje produkt (s podporou alfa)"""
         try:
-            hex_color = self.background_color.lstrip('#')
-            bg_color = (
-                int(hex_color[0:2], 16),
-                int(hex_color[2:4], 16),
-                int(hex_color[4:6], 16)
-            )
+            bg_color = self._bg_rgb
             result = Image.new('RGB', (self.target_width, self.target_height), bg_color)
             
-            bbox = self.find_product_bbox(img)
+            # Bbox z masky celého obrázku; pro RGBA je maska přesná a na výřez se jen ořízne
+            bbox, product_mask = self._find_product_bbox_and_mask(img)
             
             if bbox:
                 x1, y1, x2, y2 = bbox
@@ -436,9 +558,6 @@ class UniversalProcessor:
                 if 'A' in cropped_product.getbands() and self.png_edge_fix:
                     cropped_product = self._unmatte_rgba(cropped_product)
                 
-                # Vypočítej masku produktu v oblasti bboxu
-                mask_small = self._compute_product_mask(cropped_product)
-                
                 # Škálování včetně minimálních okrajů
                 margin_x = int(round(self.target_width * self.min_margin_ratio))
                 margin_y = int(round(self.target_height * self.min_margin_ratio))
@@ -455,18 +574,37 @@ class UniversalProcessor:
                 if 'A' in cropped_product.getbands():
                     # Pro RGBA obrázky použij přímo alfa kanál (zachová anti-aliased hrany)
                     print(f"  🔷 DEBUG: Image has Alpha channel, using native alpha for compositing")
-                    rgba_arr = np.array(cropped_product)
-                    alpha_channel = rgba_arr[:, :, 3]
-                    print(f"  🔷 DEBUG: Alpha channel stats - min: {alpha_channel.min()}, max: {alpha_channel.max()}")
-                    mask_img = Image.fromarray(alpha_channel)
+                    # Alfa zůstává v PIL (bez převodu do numpy a zpět)
+                    mask_img = cropped_product.getchannel('A')
+                    alpha_min, alpha_max = mask_img.getextrema()
+                    print(f"  🔷 DEBUG: Alpha channel stats - min: {alpha_min}, max: {alpha_max}")
+                    # Alfa maska celého obrázku je v plném rozlišení - výřez je přesný
+                    mask_small = product_mask[y1:y2, x1:x2]
                 else:
                     # Pro RGB obrázky vypočítej masku z pozadí
                     print(f"  🔶 DEBUG: Image is RGB (no alpha), using computed mask")
+                    # Flood-fill se přepočítá na výřezu a převede na jeho rozlišení - zmenšená
+                    # maska celého obrázku je pro hrany kompozice příliš hrubá
+                    mask_small = self._compute_product_mask(cropped_product)
                     mask_img = Image.fromarray((mask_small.astype(np.uint8) * 255))
+                    if mask_img.size != cropped_product.size:
+                        mask_img = mask_img.resize(cropped_product.size, Image.Resampling.NEAREST)
+                        mask_small = np.asarray(mask_img) > 0
                 
-                resized_mask = mask_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                if self.soft_edges and self.soft_edges_radius > 0:
-                    resized_mask = resized_mask.filter(ImageFilter.GaussianBlur(radius=self.soft_edges_radius))
+                # Při zmenšení masky aspoň 2x stačí BILINEAR, měkkou hranu dodá následný blur
+                will_blur = self.soft_edges and self.soft_edges_radius > 0
+                strong_downscale = will_blur and new_width * 2 <= mask_img.width and new_height * 2 <= mask_img.height
+                mask_resample = Image.Resampling.BILINEAR if strong_downscale else Image.Resampling.LANCZOS
+                resized_mask = mask_img.resize((new_width, new_height), mask_resample)
+                if will_blur:
+                    if _HAS_SCIPY and self.soft_edges_radius <= 2.0:
+                        # Malý poloměr: separabilní 1D Gauss přímo nad uint8 maskou (bez float mezivýsledku)
+                        mask_arr = np.asarray(resized_mask)
+                        mask_arr = _scipy_gaussian1d(mask_arr, sigma=self.soft_edges_radius, axis=0)
+                        mask_arr = _scipy_gaussian1d(mask_arr, sigma=self.soft_edges_radius, axis=1)
+                        resized_mask = Image.fromarray(mask_arr)
+                    else:
+                        resized_mask = resized_mask.filter(ImageFilter.GaussianBlur(radius=self.soft_edges_radius))
                 
                 # Centrovaní
                 if self.center_mode == 'centroid':
@@ -506,23 +644,10 @@ class UniversalProcessor:
                 
             else:
                 print(f"  Produkt nenalezen, používám celý obrázek")
-                img_ratio = img.width / img.height
-                target_ratio = self.target_width / self.target_height
-                if img_ratio > target_ratio:
-                    new_width = int(self.target_height * img_ratio)
-                    new_height = self.target_height
-                    resized = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                    left = (new_width - self.target_width) // 2
-                    cropped = resized.crop((left, 0, left + self.target_width, self.target_height))
-                else:
-                    new_width = self.target_width
-                    new_height = int(self.target_width / img_ratio)
-                    resized = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                    top = (new_height - self.target_height) // 2
-                    cropped = resized.crop((0, top, self.target_width, top + self.target_height))
-                paste_x = (self.target_width - cropped.width) // 2
-                paste_y = (self.target_height - cropped.height) // 2
-                result.paste(cropped, (paste_x, paste_y))
+                # Resize + středový ořez na cílový poměr stran v jednom průchodu
+                fitted = ImageOps.fit(img, (self.target_width, self.target_height),
+                                      Image.Resampling.LANCZOS, centering=(0.5, 0.5))
+                result.paste(fitted, (0, 0))
             
             return result
             
@@ -533,16 +658,12 @@ class UniversalProcessor:
     def change_background(self, img: Image.Image) -> Image.Image:
         """Změní bílé i velmi tmavé (černé) pozadí na cílovou barvu."""
         try:
-            hex_color = self.background_color.lstrip('#')
-            new_bg_color = (
-                int(hex_color[0:2], 16),
-                int(hex_color[2:4], 16),
-                int(hex_color[4:6], 16)
-            )
+            new_bg_color = self._bg_rgb
             img_array = np.array(img)
-            white_mask = np.all(img_array >= self.white_threshold, axis=2)
-            black_mask = np.all(img_array <= self.black_threshold, axis=2)
-            bg_mask = white_mask | black_mask
+            # Min/max přes kanály místo dvou (H, W, 3) boolean mezivýsledků
+            ch_min = img_array[:, :, :3].min(axis=2)
+            ch_max = img_array[:, :, :3].max(axis=2)
+            bg_mask = (ch_min >= self.white_threshold) | (ch_max <= self.black_threshold)
             img_array[bg_mask] = new_bg_color
             result = Image.fromarray(img_array)
             return result
@@ -550,23 +671,73 @@ class UniversalProcessor:
             print(f"Chyba při změně barvy pozadí: {e}")
             return img
     
-    def process_image(self, image_path: Path) -> bool:
-        """Zpracuje jeden obrázek - univerzální přístup"""
+    def _encode_webp(self, img: Image.Image, quality: int, method: int) -> bytes:
+        """Zakóduje obrázek do WEBP se zadanou kvalitou a úsilím enkodéru (method 0-6)"""
+        buf = BytesIO()
+        img.save(buf, format='WEBP', quality=max(1, quality), method=method)
+        return buf.getvalue()
+    
+    def encode_image(self, processed_img: Image.Image) -> bytes:
+        """Zakóduje zpracovaný obrázek do bytes podle výstupního formátu"""
+        if self.output_format == 'webp':
+            if self.target_max_kb is not None:
+                # Adaptivní komprese na cílovou velikost
+                max_bytes = float(self.target_max_kb) * 1024.0
+                quality_try = int(self.quality)
+                # Rychlá sonda (method=0): vejde se plná kvalita, stačí jedno finální uložení
+                if len(self._encode_webp(processed_img, quality_try, 0)) <= max_bytes:
+                    data = self._encode_webp(processed_img, quality_try, 6)
+                    # Vrací se jen změřená data - method=6 může vyjít větší než sonda
+                    if len(data) <= max_bytes:
+                        return data
+                # Binární hledání nejvyšší kvality, která se vejde (method=4, včetně plné kvality)
+                fitting = None  # (kvalita, data) nejvyšší zatím vyhovující kvality
+                lo, hi = min(int(self.min_quality), quality_try), quality_try
+                while lo <= hi:
+                    mid = (lo + hi + 1) // 2
+                    data = self._encode_webp(processed_img, mid, 4)
+                    if len(data) <= max_bytes:
+                        fitting = (mid, data)
+                        lo = mid + 1
+                    else:
+                        hi = mid - 1
+                if fitting is None:
+                    # Nevejde se ani min_quality - jako dřív vrať nejnižší povolenou kvalitu
+                    return self._encode_webp(processed_img, min(int(self.min_quality), quality_try), 6)
+                # Finální uložení s nejvyšším úsilím enkodéru, pokud se vejde; jinak vyhovující method=4
+                data = self._encode_webp(processed_img, fitting[0], 6)
+                return data if len(data) <= max_bytes else fitting[1]
+            buf = BytesIO()
+            processed_img.save(
+                buf,
+                format='WEBP',
+                quality=self.quality,
+                method=6
+            )
+        elif self.output_format == 'png':
+            buf = BytesIO()
+            processed_img.save(
+                buf,
+                format='PNG'
+            )
+        else:  # jpeg
+            buf = BytesIO()
+            processed_img.save(
+                buf,
+                format='JPEG',
+                quality=self.quality,
+                optimize=self.jpeg_optimize,
+                subsampling=self.jpeg_subsampling
+            )
+        return buf.getvalue()
+    
+    def process_image_to_bytes(self, image_path: Union[Path, BinaryIO]) -> Optional[bytes]:
+        """Zpracuje jeden obrázek a vrátí zakódovaný výstup bez zápisu na disk"""
         try:
-            try:
-                relative_path = image_path.relative_to(self.input_dir)
-            except Exception:
-                relative_path = Path(image_path.name)
-            output_path = self.output_dir / relative_path
-            output_path.parent.mkdir(parents=True, exist_ok=True)
-            # Nastav příponu podle cílového formátu
-            if self.output_format == 'webp':
-                output_path = output_path.with_suffix('.webp')
-            elif self.output_format == 'png':
-                output_path = output_path.with_suffix('.png')
-            else:
-                output_path = output_path.with_suffix('.jpg')
             with Image.open(image_path) as img:
+                # Jediné dekódování hned na začátku - load() zároveň uvolní souborový
+                # handle, další operace už pracují s načtenými pixely
+                img.load()
                 if img.mode == 'P' and 'transparency' in img.info:
                     img = img.convert('RGBA')
                 elif img.mode in ('LA',):
@@ -602,7 +773,9 @@ class UniversalProcessor:
                         orig_arr = np.array(original_rgb)
 
                         # Flood-fill detekce na originálním obrázku
-                        flood_bg_mask = self._compute_background_mask_rgb(original_rgb)
+                        flood_bg_small = self._compute_background_mask_rgb(original_rgb)
+                        flood_bg_img = Image.fromarray(flood_bg_small.astype(np.uint8) * 255)
+                        flood_bg_mask = np.array(flood_bg_img.resize(original_rgb.size, Image.Resampling.NEAREST)) > 0
                         flood_product_raw = (~flood_bg_mask).astype(np.float32)
 
                         # Flood-fill maska je hrubá (256px upscalovaná). Vyhladíme ji
@@ -624,75 +797,60 @@ class UniversalProcessor:
                     except Exception as e:
                         print(f"  ⚠️ Chyba při AI background removal: {e}")
                 
-                print(f"Zpracovávám {image_path.name}: {img.width}x{img.height}px")
+                print(f"Zpracovávám {getattr(image_path, 'name', 'obrázek z paměti')}: {img.width}x{img.height}px")
                 processed_img = self.smart_resize_and_center(img)
                 
                 if self.recolor_background:
                     processed_img = self.change_background(processed_img)
-                # Ulož podle formátu
-                if self.output_format == 'webp':
-                    if self.target_max_kb is not None:
-                        # Adaptivní komprese na cílovou velikost
-                        quality_try = int(self.quality)
-                        best_bytes = None
-                        best_quality = quality_try
-                        # Startovní uložení a kontrola velikosti
-                        for _ in range(10):  # max 10 iterací
-                            buf = BytesIO()
-                            processed_img.save(
-                                buf,
-                                format='WEBP',
-                                quality=max(1, quality_try),
-                                method=6
-                            )
-                            data = buf.getvalue()
-                            size_kb = len(data) / 1024.0
-                            best_bytes = data
-                            best_quality = quality_try
-                            if size_kb <= float(self.target_max_kb) or quality_try <= self.min_quality:
-                                break
-                            # sniž kvalitu a zkus znovu
-                            if quality_try > 85:
-                                quality_try -= 7
-                            elif quality_try > 75:
-                                quality_try -= 5
-                            else:
-                                quality_try -= 3
-                        # Zapiš nejlepší výsledek
-                        with open(output_path, 'wb') as f:
-                            f.write(best_bytes)
-                    else:
-                        processed_img.save(
-                            output_path,
-                            format='WEBP',
-                            quality=self.quality,
-                            method=6
-                        )
-                elif self.output_format == 'png':
-                    processed_img.save(
-                        output_path,
-                        format='PNG'
-                    )
-                else:  # jpeg
-                    processed_img.save(
-                        output_path,
-                        format='JPEG',
-                        quality=self.quality,
-                        optimize=True,
-                        subsampling=0
-                    )
-                return True
+                return self.encode_image(processed_img)
+        except Exception as e:
+            print(f"Chyba při zpracování {image_path}: {e}")
+            return None
+    
+    def process_image(self, image_path: Path) -> bool:
+        """Zpracuje jeden obrázek - univerzální přístup"""
+        try:
+            try:
+                relative_path = image_path.relative_to(self.input_dir)
+            except Exception:
+                relative_path = Path(image_path.name)
+            output_path = self.output_dir / relative_path
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            # Nastav příponu podle cílového formátu
+            suffix, _ = OUTPUT_FORMATS.get(self.output_format, OUTPUT_FORMATS['jpeg'])
+            output_path = output_path.with_suffix(suffix)
+            data = self.process_image_to_bytes(image_path)
+            if data is None:
+                return False
+            with open(output_path, 'wb') as f:
+                f.write(data)
+            return True
         except Exception as e:
             print(f"Chyba při zpracování {image_path}: {e}")
             return False
     
+    def process_one(self, image_path: Path) -> Tuple[str, bool]:
+        """Zpracuje jeden obrázek pro paralelní dávku - chybu nepropustí, jen vrátí False"""
+        try:
+            return image_path.name, self.process_image(image_path)
+        except Exception as e:
+            print(f"Chyba při zpracování {image_path}: {e}")
+            return image_path.name, False
+    
     def get_image_files(self) -> List[Path]:
         """Získá seznam všech obrázků ve vstupní složce"""
         image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp'}
         image_files = []
-        for file_path in self.input_dir.rglob('*'):
-            if file_path.is_file() and file_path.suffix.lower() in image_extensions:
-                image_files.append(file_path)
+        # os.scandir místo rglob: typ položky je v dirent, bez stat() a Path pro každý soubor
+        # (do symlinkovaných složek nevstupujeme, stejně jako rglob)
+        pending = [str(self.input_dir)]
+        while pending:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in image_extensions:
+                        image_files.append(Path(entry.path))
         return sorted(image_files)
     
     def process_all_images(self) -> Dict:
@@ -713,16 +871,51 @@ class UniversalProcessor:
         print(f"Kvalita JPG: {self.quality}%")
         print(f"Výstupní složka: {self.output_dir}")
         print(f"Univerzální zpracování pro všechny rozměry")
-        for image_path in tqdm(image_files, desc="Univerzální zpracování"):
-            try:
-                if self.process_image(image_path):
-                    results['processed'] += 1
-                else:
-                    results['errors'].append(str(image_path))
-            except Exception as e:
-                results['errors'].append(f"{image_path}: {e}")
+        # rembg session je náročná na RAM, s AI odstraněním pozadí max 2 procesy
+        max_workers = self.max_workers or os.cpu_count() or 1
+        if self.ai_background_removal:
+            max_workers = min(max_workers, 2)
+        max_workers = min(max_workers, len(image_files))
+        print(f"Paralelní procesy: {max_workers}")
+        if max_workers <= 1:
+            for image_path in tqdm(image_files, desc="Univerzální zpracování"):
+                try:
+                    if self.process_image(image_path):
+                        results['processed'] += 1
+                    else:
+                        results['errors'].append(str(image_path))
+                except Exception as e:
+                    results['errors'].append(f"{image_path}: {e}")
+            return results
+        # Každý worker si jednou sestaví vlastní procesor z konfigurace (PIL objekty se nepicklují)
+        worker_config = dict(self.config, input_dir=str(self.input_dir), output_dir=str(self.output_dir))
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(worker_config,)) as executor:
+            futures = {executor.submit(_process_path, image_path): image_path for image_path in image_files}
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Univerzální zpracování"):
+                image_path = futures[future]
+                try:
+                    if future.result():
+                        results['processed'] += 1
+                    else:
+                        results['errors'].append(str(image_path))
+                except Exception as e:
+                    results['errors'].append(f"{image_path}: {e}")
         return results
 
+
+# Procesor worker procesu pro process_all_images, vytvořený jednou v _init_worker()
+_WORKER_PROCESSOR = None
+
+def _init_worker(config: Dict) -> None:
+    """Sestaví procesor jednou pro každý worker proces"""
+    global _WORKER_PROCESSOR
+    _WORKER_PROCESSOR = UniversalProcessor(config)
+
+def _process_path(image_path: Path) -> bool:
+    """Zpracuje jeden soubor procesorem aktuálního worker procesu"""
+    return _WORKER_PROCESSOR.process_image(image_path)
+
 def main():
     parser = argparse.ArgumentParser(description='Universal Processor')
     parser.add_argument('--input', default='input_images', help='Vstupní složka s obrázky')
@@ -731,6 +924,8 @@ def main():
     parser.add_argument('--width', type=int, default=400, help='Cílová šířka (výchozí: 400)')
     parser.add_argument('--height', type=int, default=400, help='Cílová výška (výchozí: 400)')
     parser.add_argument('--quality', type=int, default=98, help='Kvalita JPG (1-100, výchozí: 98)')
+    parser.add_argument('--optimize', action='store_true', help='Optimalizované Huffmanovy tabulky JPG (menší soubory, pomalejší enkódování)')
+    parser.add_argument('--subsampling', type=int, choices=[0, 1, 2], default=2, help='Chroma subsampling JPG: 2 = 4:2:0 pro web (výchozí), 0 = 4:4:4 pro zdrojové mastery')
     parser.add_argument('--min-quality', type=int, default=65, help='Minimální kvalita při adaptivní WEBP kompresi (výchozí: 65)')
     parser.add_argument('--target-max-kb', type=int, default=None, help='Cílová maximální velikost souboru ve kB pro WEBP (např. 120). Výchozí: vypnuto')
     parser.add_argument('--format', choices=['jpeg', 'webp', 'png'], default='jpeg', help='Výstupní formát (jpeg/webp/png)')
@@ -748,6 +943,7 @@ def main():
     parser.add_argument('--png-matte', default='#FFFFFF', help='Barva matte pro PNG unmatte (hex, výchozí: #FFFFFF)')
     parser.add_argument('--flatten-png-first', action='store_true', help='Nejprve zploštit PNG s alfou na bílé pozadí (simulace JPG)')
     parser.add_argument('--edge-barrier-threshold', type=int, default=10, help='Práh gradientu pro bariéru flood fill (0=vypnuto, výchozí: 10)')
+    parser.add_argument('--workers', type=int, default=None, help='Počet paralelních procesů pro dávku (výchozí: počet CPU, 1 = sekvenčně)')
     
     args = parser.parse_args()
     
@@ -756,6 +952,8 @@ def main():
         'target_width': args.width,
         'target_height': args.height,
         'quality': args.quality,
+        'jpeg_optimize': args.optimize,
+        'jpeg_subsampling': args.subsampling,
         'min_quality': args.min_quality,
         'target_max_kb': args.target_max_kb,
         'output_format': args.format,
@@ -774,7 +972,8 @@ def main():
         'png_edge_fix': args.png_edge_fix,
         'png_matte': args.png_matte,
         'flatten_png_first': args.flatten_png_first,
-        'edge_barrier_threshold': args.edge_barrier_threshold
+        'edge_barrier_threshold': args.edge_barrier_threshold,
+        'max_workers': args.workers
     }
     
     # Kontrola existence vstupní složky
@@ -6,14 +6,51 @@ S automatickým upscalingem malých obrázků pomocí Real-ESRGAN
 """
 
 import os
-from PIL import Image
+import logging
+from io import BytesIO
+from PIL import Image, ImageOps, ImageStat
 from tqdm import tqdm
 from pathlib import Path
 from typing import List, Dict, Tuple, Optional
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 import argparse
 import numpy as np
 import json
 
+# Průběh po obrázcích jde do loggeru (DEBUG) - při výchozí úrovni WARNING
+# nestojí úspěšná cesta žádný zápis na stdout
+logger = logging.getLogger(__name__)
+
+# Volitelná numba pro sloučenou záměnu bílých pixelů v change_background
+# Bez numby se použije vektorizovaný NumPy
+try:
+    import numba as _numba
+    _HAS_NUMBA = True
+except ImportError:
+    _HAS_NUMBA = False
+
+# Volitelné OpenCV pro zmenšování produktu (INTER_AREA)
+# Bez OpenCV se zmenšuje přes Pillow LANCZOS
+try:
+    import cv2 as _cv2
+    _HAS_CV2 = True
+except ImportError:
+    _HAS_CV2 = False
+
+# Sériově (bez parallel/prange): paralelizuje se přes obrázky v ProcessPoolExecutor
+if _HAS_NUMBA:
+    @_numba.njit(nogil=True, cache=True)
+    def _replace_white_kernel(rgb_u8, t, color):
+        """Přebarví pixely se všemi kanály >= t na color, in-place v rgb_u8"""
+        h, w, _ = rgb_u8.shape
+        r, g, b = color[0], color[1], color[2]
+        for y in range(h):
+            for x in range(w):
+                if rgb_u8[y, x, 0] >= t and rgb_u8[y, x, 1] >= t and rgb_u8[y, x, 2] >= t:
+                    rgb_u8[y, x, 0] = r
+                    rgb_u8[y, x, 1] = g
+                    rgb_u8[y, x, 2] = b
+
 def load_config(config_path: str = "config.json") -> Dict:
     """Načte konfiguraci ze souboru"""
     try:
@@ -34,10 +71,13 @@ def get_default_config() -> Dict:
         "target_size": [1000, 1000],
         "background_color": "#F3F3F3",
         "quality": 95,
+        "jpeg_optimize": False,
+        "jpeg_subsampling": 2,
         "white_threshold": 240,
         "product_size_ratio": 0.75,
         "auto_upscale": False,
         "upscale_threshold": 800,
+        "upscale_min_pixels": 500000,
         "upscale_method": "multi-scale",
         "input_dir": "input_images",
         "output_dir": "processed_images"
@@ -49,12 +89,35 @@ class UniversalProcessor:
         self.target_width = config.get('target_width', 400)
         self.target_height = config.get('target_height', 400)
         self.quality = config.get('quality', 95)
+        # Optimalizované Huffmanovy tabulky (~9 % menší soubor, ~2.5x pomalejší enkódování)
+        self.jpeg_optimize = config.get('jpeg_optimize', False)
+        # Chroma subsampling JPG: 2 = 4:2:0 (web, ~40 % rychlejší enkódování, menší soubory),
+        # 0 = 4:4:4 jen pro zdrojové mastery
+        self.jpeg_subsampling = config.get('jpeg_subsampling', 2)
         self.background_color = config.get('background_color', '#F3F3F3')
         self.white_threshold = config.get('white_threshold', 240)
         self.product_size_ratio = config.get('product_size_ratio', 0.75)
         self.auto_upscale = config.get('auto_upscale', True)  # Nová funkce
         self.upscale_threshold = config.get('upscale_threshold', 800)  # Prah pro upscale
+        self.upscale_min_pixels = config.get('upscale_min_pixels', 500000)  # Min. počet pixelů bez upscale
         self.upscale_method = config.get('upscale_method', 'multi-scale')  # Metoda upscalingu
+        self.max_workers = config.get('max_workers', None)  # Počet procesů (None = počet CPU)
+        # Zmenšené dekódování velkých JPEG (DCT škálování 1/2, 1/4, 1/8 v libjpeg)
+        self.jpeg_draft = config.get('jpeg_draft', True)
+        
+        # Barva pozadí naparsovaná jednou (ne při každém obrázku)
+        hex_color = self.background_color.lstrip('#')
+        self._bg_rgb = tuple(int(hex_color[i:i + 2], 16) for i in (0, 2, 4))
+        self._bg_rgb_np = np.array(self._bg_rgb, dtype=np.uint8)
+        
+        # LUT pro Image.point: 255 pro pixely pod prahem bílé (pro každý kanál RGB)
+        band_lut = [255 if v < self.white_threshold else 0 for v in range(256)]
+        self._product_lut = band_lut * 3
+        
+        # Pomocné bool buffery pro masky v change_background - alokují se jednou
+        # a znovu používají (všechny obrázky mají po resize stejnou velikost)
+        self._scratch_mask = None
+        self._scratch_tmp = None
         
         # Vytvoření složek
         self.input_dir = Path(config.get('input_dir', 'input_images'))
@@ -64,20 +127,13 @@ class UniversalProcessor:
     def needs_upscaling(self, img: Image.Image) -> bool:
         """Zkontroluje, zda obrázek potřebuje upscale"""
         width, height = img.size
-        
-        # Malý obrázek
-        if width < self.upscale_threshold or height < self.upscale_threshold:
-            return True
-        
-        # Nekvalitní obrázek (nízké rozlišení)
-        if width * height < 500000:  # 500k pixelů
-            return True
-        
-        return False
+        # Malý obrázek (kratší strana pod prahem) nebo nízké rozlišení (málo pixelů)
+        threshold = self.upscale_threshold
+        return width < threshold or height < threshold or width * height < self.upscale_min_pixels
     
     def upscale_with_realesrgan(self, img: Image.Image) -> Image.Image:
         """Placeholder pro Real-ESRGAN upscaling"""
-        print(f"    Používám pokročilý upscaling...")
+        logger.debug("    Používám pokročilý upscaling...")
         return self.multi_scale_upscale(img)
     
     def _get_upscale_method(self):
@@ -89,6 +145,18 @@ class UniversalProcessor:
         }
         return methods.get(self.upscale_method, self.multi_scale_upscale)
     
+    def _enhance_contrast(self, img: Image.Image, factor: float) -> Image.Image:
+        """ImageEnhance.Contrast jako jeden průchod Image.point
+
+        Kontrast je bodová operace kolem průměrného jasu, takže místo šedého plátna
+        a Image.blend stačí 256prvková LUT - výsledek je bit po bitu stejný
+        (float32 aritmetika a ořez jako v Pillow).
+        """
+        mean = np.float32(int(ImageStat.Stat(img.convert('L')).mean[0] + 0.5))
+        values = mean + np.float32(factor) * (np.arange(256, dtype=np.float32) - mean)
+        lut = np.clip(values, 0, 255).astype(np.uint8).tolist()
+        return img.point(lut * len(img.getbands()))
+    
     def advanced_upscale(self, img: Image.Image) -> Image.Image:
         """Pokročilý upscale s více metodami pro lepší kvalitu"""
         try:
@@ -96,21 +164,8 @@ class UniversalProcessor:
             new_width = img.width * 2
             new_height = img.height * 2
             
-            # Metoda 1: LANCZOS s vysokou kvalitou
-            upscaled_lanczos = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            # Metoda 2: BICUBIC pro porovnání
-            upscaled_bicubic = img.resize((new_width, new_height), Image.Resampling.BICUBIC)
-            
-            # Metoda 3: Iterativní upscale (2x menší kroky)
-            temp_width = int(img.width * 1.5)
-            temp_height = int(img.height * 1.5)
-            temp_img = img.resize((temp_width, temp_height), Image.Resampling.LANCZOS)
-            upscaled_iterative = temp_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            # Vybereme nejlepší výsledek (můžeme porovnat ostrost)
-            # Pro jednoduchost použijeme LANCZOS, ale můžeme přidat analýzu kvality
-            best_result = upscaled_lanczos
+            # LANCZOS s vysokou kvalitou (jediná metoda, jejíž výsledek se používá)
+            best_result = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
             
             # Přidáme jemné ostření pro lepší detaily
             from PIL import ImageEnhance
@@ -118,13 +173,12 @@ class UniversalProcessor:
             sharpened = sharpener.enhance(1.2)  # Mírné ostření
             
             # Přidáme jemné zvýšení kontrastu
-            contrast_enhancer = ImageEnhance.Contrast(sharpened)
-            enhanced = contrast_enhancer.enhance(1.1)  # Mírné zvýšení kontrastu
+            enhanced = self._enhance_contrast(sharpened, 1.1)  # Mírné zvýšení kontrastu
             
             return enhanced
             
         except Exception as e:
-            print(f"    Chyba při pokročilém upscalingu: {e}")
+            logger.error("    Chyba při pokročilém upscalingu: %s", e)
             return img
     
     def multi_scale_upscale(self, img: Image.Image) -> Image.Image:
@@ -133,18 +187,9 @@ class UniversalProcessor:
             new_width = img.width * 2
             new_height = img.height * 2
             
-            # Různé upscaling metody
-            methods = {
-                'lanczos': img.resize((new_width, new_height), Image.Resampling.LANCZOS),
-                'bicubic': img.resize((new_width, new_height), Image.Resampling.BICUBIC),
-                'hamming': img.resize((new_width, new_height), Image.Resampling.HAMMING),
-                'box': img.resize((new_width, new_height), Image.Resampling.BOX)
-            }
-            
-            # Pro produktové obrázky je LANCZOS obvykle nejlepší
-            # Můžeme přidat analýzu kvality pro automatický výběr
-            best_method = 'lanczos'
-            result = methods[best_method]
+            # Pro produktové obrázky je LANCZOS obvykle nejlepší,
+            # počítá se jen zvolená metoda
+            result = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
             
             # Post-processing pro lepší kvalitu
             from PIL import ImageFilter, ImageEnhance
@@ -152,9 +197,8 @@ class UniversalProcessor:
             # Jemné ostření
             sharpened = result.filter(ImageFilter.UnsharpMask(radius=1, percent=150, threshold=3))
             
-            # Zvýšení kontrastu
-            contrast_enhancer = ImageEnhance.Contrast(sharpened)
-            enhanced = contrast_enhancer.enhance(1.05)
+            # Zvýšení kontrastu (jeden průchod přes LUT)
+            enhanced = self._enhance_contrast(sharpened, 1.05)
             
             # Jemné zvýšení sytosti
             saturation_enhancer = ImageEnhance.Color(enhanced)
@@ -163,7 +207,7 @@ class UniversalProcessor:
             return final
             
         except Exception as e:
-            print(f"    Chyba při multi-scale upscalingu: {e}")
+            logger.error("    Chyba při multi-scale upscalingu: %s", e)
             return img
 
     def basic_upscale(self, img: Image.Image) -> Image.Image:
@@ -173,7 +217,7 @@ class UniversalProcessor:
             new_height = img.height * 2
             return img.resize((new_width, new_height), Image.Resampling.LANCZOS)
         except Exception as e:
-            print(f"    Chyba při základním upscalingu: {e}")
+            logger.error("    Chyba při základním upscalingu: %s", e)
             return img
     
     def auto_upscale_image(self, img: Image.Image) -> Image.Image:
@@ -182,16 +226,20 @@ class UniversalProcessor:
             return img
         
         if self.needs_upscaling(img):
-            print(f"  Malý obrázek detekován ({img.width}x{img.height}px), upscaluji...")
-            
-            # Pokus o Real-ESRGAN, fallback na základní upscale
-            upscaled = self.upscale_with_realesrgan(img)
-            
-            print(f"  Upscalováno na: {upscaled.width}x{upscaled.height}px")
-            return upscaled
+            return self._upscale_small_image(img)
         
         return img
     
+    def _upscale_small_image(self, img: Image.Image) -> Image.Image:
+        """Upscale obrázku, o kterém už je rozhodnuto, že je malý"""
+        logger.debug("  Malý obrázek detekován (%dx%dpx), upscaluji...", img.width, img.height)
+        
+        # Pokus o Real-ESRGAN, fallback na základní upscale
+        upscaled = self.upscale_with_realesrgan(img)
+        
+        logger.debug("  Upscalováno na: %dx%dpx", upscaled.width, upscaled.height)
+        return upscaled
+    
     def find_product_bbox(self, img: Image.Image) -> Optional[Tuple[int, int, int, int]]:
         """Najde bounding box produktu s vylepšenou detekcí"""
         try:
@@ -199,51 +247,41 @@ class UniversalProcessor:
             if img.mode != 'RGB':
                 img = img.convert('RGB')
             
-            # Konverze do numpy array
-            img_array = np.array(img)
-            
-            # Vytvoření masky pro bílé pozadí (mírnější prah)
-            white_mask = np.all(img_array >= self.white_threshold, axis=2)
-            
-            # Najdeme ne-bílé pixely (produkt)
-            product_mask = ~white_mask
+            # Ne-bílé pixely (aspoň jeden kanál pod prahem) prahuje Pillow přes LUT
+            # a getbbox najde jejich hranice v C - bez numpy kopie obrázku
+            bbox = img.point(self._product_lut).getbbox()
             
-            if not np.any(product_mask):
+            if bbox is None:
                 return None
             
-            # Najdeme hranice produktu
-            rows = np.any(product_mask, axis=1)
-            cols = np.any(product_mask, axis=0)
-            
-            y1, y2 = np.where(rows)[0][[0, -1]]
-            x1, x2 = np.where(cols)[0][[0, -1]]
+            # getbbox vrací pravý/dolní okraj exkluzivně, chceme poslední pixel
+            x1, y1, x2, y2 = bbox
+            x2 -= 1
+            y2 -= 1
             
             # Přidáme malý padding (10px) pro lepší vzhled
             padding = 10
             x1 = max(0, x1 - padding)
             y1 = max(0, y1 - padding)
-            x2 = min(img_array.shape[1], x2 + padding)
-            y2 = min(img_array.shape[0], y2 + padding)
+            x2 = min(img.width, x2 + padding)
+            y2 = min(img.height, y2 + padding)
             
             return (x1, y1, x2, y2)
             
         except Exception as e:
-            print(f"Chyba při hledání bounding box: {e}")
+            logger.error("Chyba při hledání bounding box: %s", e)
             return None
     
     def smart_resize_and_center(self, img: Image.Image) -> Image.Image:
         """Chytře změní velikost a vycentruje produkt"""
+        result, _ = self._smart_resize_and_center_region(img)
+        return result
+    
+    def _smart_resize_and_center_region(self, img: Image.Image) -> Tuple[Image.Image, Optional[Tuple[int, int, int, int]]]:
+        """Jako smart_resize_and_center, navíc vrátí oblast (x1, y1, x2, y2), kam byl vložen obsah"""
         try:
-            # Konverze hex barvy na RGB pro pozadí
-            hex_color = self.background_color.lstrip('#')
-            bg_color = (
-                int(hex_color[0:2], 16),
-                int(hex_color[2:4], 16),
-                int(hex_color[4:6], 16)
-            )
-            
             # Vytvoření nového obrázku se šedým pozadím
-            result = Image.new('RGB', (self.target_width, self.target_height), bg_color)
+            result = Image.new('RGB', (self.target_width, self.target_height), self._bg_rgb)
             
             # Najdeme bounding box produktu
             bbox = self.find_product_bbox(img)
@@ -269,8 +307,18 @@ class UniversalProcessor:
                 new_width = int(product_width * scale)
                 new_height = int(product_height * scale)
                 
-                # Zvětšíme produkt s vysokou kvalitou
-                resized_product = cropped_product.resize((new_width, new_height), Image.Resampling.LANCZOS)
+                if _HAS_CV2 and scale < 1 and cropped_product.mode == 'RGB':
+                    # Zmenšení přes OpenCV INTER_AREA (plošné průměrování určené pro
+                    # zmenšování, bez aliasingu a rychlejší než LANCZOS)
+                    resized_product = Image.fromarray(_cv2.resize(
+                        np.asarray(cropped_product), (new_width, new_height),
+                        interpolation=_cv2.INTER_AREA
+                    ))
+                else:
+                    # Zvětšíme produkt s vysokou kvalitou; při velkém zmenšení nejdřív rychlé
+                    # celočíselné blokové průměrování (Image.reduce) na max. 2x cíle, pak LANCZOS
+                    resized_product = cropped_product.resize((new_width, new_height), Image.Resampling.LANCZOS,
+                                                             reducing_gap=2.0)
                 
                 # Vypočítáme pozici pro centrování
                 paste_x = (self.target_width - new_width) // 2
@@ -279,41 +327,31 @@ class UniversalProcessor:
                 # Vložíme produkt do centra
                 result.paste(resized_product, (paste_x, paste_y))
                 
-                print(f"  Produkt: {product_width}x{product_height}px → {new_width}x{new_height}px")
-                print(f"  Pozice: ({paste_x}, {paste_y})")
+                logger.debug("  Produkt: %dx%dpx → %dx%dpx", product_width, product_height, new_width, new_height)
+                logger.debug("  Pozice: (%d, %d)", paste_x, paste_y)
+                
+                region = (paste_x, paste_y, paste_x + new_width, paste_y + new_height)
                 
             else:
                 # Pokud nenajdeme produkt, použijeme celý obrázek s centrováním
-                print(f"  Produkt nenalezen, používám celý obrázek")
-                
-                # Vypočítáme poměr stran
-                img_ratio = img.width / img.height
-                target_ratio = self.target_width / self.target_height
+                logger.debug("  Produkt nenalezen, používám celý obrázek")
                 
-                if img_ratio > target_ratio:
-                    # Obrázek je širší - ořízneme po stranách
-                    new_width = int(self.target_height * img_ratio)
-                    new_height = self.target_height
-                    resized = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                    left = (new_width - self.target_width) // 2
-                    cropped = resized.crop((left, 0, left + self.target_width, self.target_height))
-                else:
-                    # Obrázek je vyšší - ořízneme nahoře/dole
-                    new_width = self.target_width
-                    new_height = int(self.target_width / img_ratio)
-                    resized = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                    top = (new_height - self.target_height) // 2
-                    cropped = resized.crop((0, top, self.target_width, top + self.target_height))
+                # Resize + středový ořez na cílový poměr stran v jednom průchodu
+                # (fit nejdřív spočítá ořez a převzorkuje jen ponechanou část)
+                cropped = ImageOps.fit(img, (self.target_width, self.target_height),
+                                       Image.Resampling.LANCZOS, centering=(0.5, 0.5))
                 
                 paste_x = (self.target_width - cropped.width) // 2
                 paste_y = (self.target_height - cropped.height) // 2
                 result.paste(cropped, (paste_x, paste_y))
+                
+                region = (paste_x, paste_y, paste_x + cropped.width, paste_y + cropped.height)
             
-            return result
+            return result, region
             
         except Exception as e:
-            print(f"Chyba při změně velikosti: {e}")
-            return img
+            logger.error("Chyba při změně velikosti: %s", e)
+            return img, None
     
     def get_product_bbox(self, img: Image.Image) -> Optional[Tuple[int, int, int, int]]:
         """Najde bounding box produktu (bez šedého pozadí)"""
@@ -322,23 +360,16 @@ class UniversalProcessor:
             if img.mode != 'RGB':
                 img = img.convert('RGB')
             
-            # Konverze hex barvy na RGB pro porovnání
-            hex_color = self.background_color.lstrip('#')
-            bg_color = np.array([
-                int(hex_color[0:2], 16),
-                int(hex_color[2:4], 16),
-                int(hex_color[4:6], 16)
-            ])
+            bg_color = self._bg_rgb
             
             # Konverze do numpy array
             img_array = np.array(img)
             
-            # Vytvoření masky pro šedé pozadí (s tolerancí)
+            # Najdeme ne-šedé pixely (produkt) - aspoň jeden kanál mimo toleranci od pozadí
             tolerance = 10
-            bg_mask = np.all(np.abs(img_array - bg_color) <= tolerance, axis=2)
-            
-            # Najdeme ne-šedé pixely (produkt)
-            product_mask = ~bg_mask
+            product_mask = np.zeros(img_array.shape[:2], dtype=bool)
+            for c in range(3):
+                product_mask |= np.abs(img_array[:, :, c].astype(np.int16) - bg_color[c]) > tolerance
             
             if not np.any(product_mask):
                 return None
@@ -347,34 +378,62 @@ class UniversalProcessor:
             rows = np.any(product_mask, axis=1)
             cols = np.any(product_mask, axis=0)
             
-            y1, y2 = np.where(rows)[0][[0, -1]]
-            x1, x2 = np.where(cols)[0][[0, -1]]
+            # První/poslední True přes argmax bez alokace pole indexů
+            y1 = int(rows.argmax())
+            y2 = len(rows) - 1 - int(rows[::-1].argmax())
+            x1 = int(cols.argmax())
+            x2 = len(cols) - 1 - int(cols[::-1].argmax())
             
             return (x1, y1, x2 + 1, y2 + 1)
             
         except Exception as e:
-            print(f"Chyba při hledání bounding box: {e}")
+            logger.error("Chyba při hledání bounding box: %s", e)
             return None
     
-    def change_background(self, img: Image.Image) -> Image.Image:
-        """Změní bílé pozadí na #F3F3F3"""
+    def _get_scratch_masks(self, height: int, width: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Vrátí dva bool buffery (height, width), při větším obrázku je přealokuje"""
+        scratch = self._scratch_mask
+        if scratch is None or scratch.shape[0] < height or scratch.shape[1] < width:
+            shape = (max(height, self.target_height), max(width, self.target_width))
+            self._scratch_mask = np.empty(shape, dtype=bool)
+            self._scratch_tmp = np.empty(shape, dtype=bool)
+        return self._scratch_mask[:height, :width], self._scratch_tmp[:height, :width]
+    
+    def change_background(self, img: Image.Image,
+                          region: Optional[Tuple[int, int, int, int]] = None) -> Image.Image:
+        """Změní bílé pozadí na #F3F3F3
+
+        Pokud je zadána oblast (x1, y1, x2, y2), prochází se jen ta - zbytek plátna
+        po smart_resize_and_center už barvu pozadí má.
+        """
         try:
-            # Konverze hex barvy na RGB
-            hex_color = self.background_color.lstrip('#')
-            new_bg_color = (
-                int(hex_color[0:2], 16),
-                int(hex_color[2:4], 16),
-                int(hex_color[4:6], 16)
-            )
+            new_bg_color = self._bg_rgb_np
             
             # Konverze do numpy array
             img_array = np.array(img)
             
-            # Vytvoření masky pro bílé pixely
-            white_mask = np.all(img_array >= self.white_threshold, axis=2)
+            # Jen vložená oblast (view, změny se propíšou do img_array)
+            if region is not None:
+                x1, y1, x2, y2 = region
+                sub = img_array[y1:y2, x1:x2]
+            else:
+                sub = img_array
             
-            # Změna barvy bílých pixelů
-            img_array[white_mask] = new_bg_color
+            t = self.white_threshold
+            if _HAS_NUMBA:
+                # Porovnání i přebarvení v jedné smyčce, bez bool masky
+                _replace_white_kernel(sub, t, new_bg_color)
+            else:
+                # Vytvoření masky pro bílé pixely do předalokovaných bufferů (bez temporárních polí)
+                white_mask, tmp = self._get_scratch_masks(sub.shape[0], sub.shape[1])
+                np.greater_equal(sub[:, :, 0], t, out=white_mask)
+                np.greater_equal(sub[:, :, 1], t, out=tmp)
+                white_mask &= tmp
+                np.greater_equal(sub[:, :, 2], t, out=tmp)
+                white_mask &= tmp
+                
+                # Změna barvy bílých pixelů
+                sub[white_mask] = new_bg_color
             
             # Konverze zpět na PIL Image
             result = Image.fromarray(img_array)
@@ -382,52 +441,87 @@ class UniversalProcessor:
             return result
             
         except Exception as e:
-            print(f"Chyba při změně barvy pozadí: {e}")
+            logger.error("Chyba při změně barvy pozadí: %s", e)
             return img
     
-    def process_image(self, image_path: Path) -> bool:
-        """Zpracuje jeden obrázek - univerzální přístup s auto-upscalingem"""
+    def load_image(self, image_path: Path) -> Tuple[Image.Image, bool]:
+        """Načte a dekóduje obrázek, vrátí (RGB obrázek, zda ho upscalovat)"""
+        img = Image.open(image_path)
         try:
-            # Vytvoření výstupní cesty
-            relative_path = image_path.relative_to(self.input_dir)
-            output_path = self.output_dir / relative_path
+            logger.debug("Zpracovávám %s: %dx%dpx", image_path.name, img.width, img.height)
+            
+            # O upscale se rozhoduje jednou podle původní velikosti (před draft)
+            upscale = self.auto_upscale and self.needs_upscaling(img)
             
-            # Vytvoření složek pokud neexistují
-            output_path.parent.mkdir(parents=True, exist_ok=True)
+            # Velké JPEG dekódujeme rovnou zmenšené (aspoň na 2x cílovou velikost),
+            # plné rozlišení by se stejně zahodilo při resize na cílovou velikost
+            if self.jpeg_draft and img.format == 'JPEG' and not upscale:
+                img.draft('RGB', (self.target_width * 2, self.target_height * 2))
             
-            # Změna přípony na .jpg
-            output_path = output_path.with_suffix('.jpg')
+            # Jediné dekódování (po draft) - load() zároveň uvolní souborový handle
+            img.load()
             
-            # Načtení obrázku
-            with Image.open(image_path) as img:
-                # Konverze na RGB pokud není
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
+            # Konverze na RGB pokud není
+            if img.mode != 'RGB':
+                converted = img.convert('RGB')
+                img.close()
+                img = converted
+            
+            return img, upscale
+        except Exception:
+            img.close()
+            raise
+    
+    def process_image(self, image_path: Path, preloaded: Optional[Future] = None) -> bool:
+        """Zpracuje jeden obrázek - univerzální přístup s auto-upscalingem
+
+        preloaded je volitelný Future s výsledkem load_image (dekódování předem v jiném vlákně).
+        """
+        try:
+            # Načtení obrázku jako první krok - předem načtený obrázek se tak vždy
+            # převezme a zavře, i když selže cokoli dalšího (chyba dekódování
+            # z vlákna se vyhodí až tady)
+            img, upscale = preloaded.result() if preloaded is not None else self.load_image(image_path)
+            
+            with img:
+                # Vytvoření výstupní cesty
+                relative_path = image_path.relative_to(self.input_dir)
+                output_path = self.output_dir / relative_path
+                
+                # Vytvoření složek pokud neexistují
+                output_path.parent.mkdir(parents=True, exist_ok=True)
                 
-                print(f"Zpracovávám {image_path.name}: {img.width}x{img.height}px")
+                # Změna přípony na .jpg
+                output_path = output_path.with_suffix('.jpg')
                 
                 # Krok 0: Automatický upscale malých obrázků
-                img = self.auto_upscale_image(img)
+                if upscale:
+                    img = self._upscale_small_image(img)
                 
                 # Krok 1: Chytře změníme velikost a vycentrujeme produkt
-                processed_img = self.smart_resize_and_center(img)
+                processed_img, region = self._smart_resize_and_center_region(img)
                 
-                # Krok 2: Změníme bílé pozadí na šedé
-                processed_img = self.change_background(processed_img)
+                # Krok 2: Změníme bílé pozadí na šedé (jen ve vložené oblasti)
+                processed_img = self.change_background(processed_img, region)
                 
-                # Uložení s vysokou kvalitou
+                # Uložení s vysokou kvalitou - enkódování do paměti
+                buf = BytesIO()
                 processed_img.save(
-                    output_path,
+                    buf,
                     format='JPEG',
                     quality=self.quality,
-                    optimize=True,
-                    subsampling=0
+                    optimize=self.jpeg_optimize,
+                    subsampling=self.jpeg_subsampling
                 )
-                
-                return True
+            
+            # Zápis jedním voláním až po zavření vstupu (chyba enkodéru nenechá
+            # na disku useknutý soubor)
+            output_path.write_bytes(buf.getbuffer())
+            
+            return True
                 
         except Exception as e:
-            print(f"Chyba při zpracování {image_path}: {e}")
+            logger.error("Chyba při zpracování %s: %s", image_path, e)
             return False
     
     def get_image_files(self) -> List[Path]:
@@ -435,9 +529,16 @@ class UniversalProcessor:
         image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp'}
         image_files = []
         
-        for file_path in self.input_dir.rglob('*'):
-            if file_path.is_file() and file_path.suffix.lower() in image_extensions:
-                image_files.append(file_path)
+        # os.scandir místo rglob: typ položky je v dirent, bez stat() a Path pro každý soubor
+        # (do symlinkovaných složek nevstupujeme, stejně jako rglob)
+        pending = [str(self.input_dir)]
+        while pending:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in image_extensions:
+                        image_files.append(Path(entry.path))
         
         return sorted(image_files)
     
@@ -466,18 +567,74 @@ class UniversalProcessor:
         print(f"Výstupní složka: {self.output_dir}")
         print(f"Univerzální zpracování pro všechny rozměry")
         
-        for image_path in tqdm(image_files, desc="Univerzální zpracování"):
-            try:
-                if self.process_image(image_path):
-                    results['processed'] += 1
-                else:
-                    results['errors'].append(str(image_path))
-            except Exception as e:
-                results['errors'].append(f"{image_path}: {e}")
+        # Obrázky jsou nezávislé - zpracování běží paralelně v procesech
+        max_workers = min(self.max_workers or os.cpu_count() or 1, len(image_files))
+        print(f"Paralelní procesy: {max_workers}")
+        
+        # Každý proces si jednou vytvoří vlastní procesor z konfigurace
+        worker_config = dict(self.config, input_dir=str(self.input_dir), output_dir=str(self.output_dir))
+        # Po dávkách (chunksize) kvůli režii IPC, ale dost malých pro vyrovnání zátěže
+        chunksize = max(1, len(image_files) // (max_workers * 4))
+        chunks = [image_files[i:i + chunksize] for i in range(0, len(image_files), chunksize)]
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(worker_config, logging.getLogger().level)) as executor, \
+                tqdm(total=len(image_files), desc="Univerzální zpracování") as progress:
+            for chunk, outcomes in zip(chunks, executor.map(_process_chunk, chunks)):
+                for image_path, (ok, error) in zip(chunk, outcomes):
+                    if ok:
+                        results['processed'] += 1
+                    elif error:
+                        results['errors'].append(f"{image_path}: {error}")
+                    else:
+                        results['errors'].append(str(image_path))
+                progress.update(len(chunk))
         
         return results
 
 
+def _setup_logging(level: int) -> None:
+    """Nastaví výpis logu na stderr (jen text zprávy, jako dřívější print)"""
+    logging.basicConfig(level=level, format='%(message)s')
+    logging.getLogger('PIL').setLevel(logging.WARNING)
+
+# Procesor worker procesu, vytvořený jednou v _init_worker()
+_WORKER_PROCESSOR = None
+
+def _init_worker(config: Dict, log_level: int = logging.WARNING) -> None:
+    """Vytvoří procesor jednou pro každý worker proces"""
+    global _WORKER_PROCESSOR
+    # Při spawn (macOS/Windows) worker nedědí nastavení logování z main()
+    if not logging.getLogger().handlers:
+        _setup_logging(log_level)
+    # Paralelizuje se přes procesy, vlastní vlákna OpenCV by jen soupeřila o jádra
+    if _HAS_CV2:
+        _cv2.setNumThreads(1)
+    _WORKER_PROCESSOR = UniversalProcessor(config)
+
+def _process_path(image_path: Path, preloaded: Optional[Future] = None) -> Tuple[bool, Optional[str]]:
+    """Zpracuje jeden obrázek ve worker procesu, vrátí (úspěch, chyba)"""
+    try:
+        return _WORKER_PROCESSOR.process_image(image_path, preloaded), None
+    except Exception as e:
+        return False, str(e)
+
+def _process_chunk(image_paths: List[Path]) -> List[Tuple[bool, Optional[str]]]:
+    """Zpracuje dávku obrázků ve worker procesu jako dvoustupňovou pipeline
+
+    Vedlejší vlákno dekóduje další obrázek (libjpeg/zlib uvolňují GIL), zatímco
+    hlavní vlákno zpracovává a enkóduje aktuální. Předem je načtený nejvýš jeden obrázek.
+    """
+    outcomes = []
+    with ThreadPoolExecutor(max_workers=1) as loader:
+        next_load = loader.submit(_WORKER_PROCESSOR.load_image, image_paths[0])
+        for i, image_path in enumerate(image_paths):
+            current = next_load
+            if i + 1 < len(image_paths):
+                next_load = loader.submit(_WORKER_PROCESSOR.load_image, image_paths[i + 1])
+            outcomes.append(_process_path(image_path, current))
+    return outcomes
+
+
 
 def main():
     parser = argparse.ArgumentParser(description='Universal Processor with Configuration File')
@@ -487,12 +644,19 @@ def main():
     parser.add_argument('--width', type=int, help='Cílová šířka (přepíše config)')
     parser.add_argument('--height', type=int, help='Cílová výška (přepíše config)')
     parser.add_argument('--quality', type=int, help='Kvalita JPG 1-100 (přepíše config)')
+    parser.add_argument('--optimize', action='store_true', help='Optimalizované Huffmanovy tabulky JPG - menší soubory, pomalejší (přepíše config)')
+    parser.add_argument('--subsampling', type=int, choices=[0, 1, 2], help='Chroma subsampling JPG: 2 = 4:2:0 (web), 0 = 4:4:4 pro zdrojové mastery (přepíše config)')
     parser.add_argument('--background-color', help='Barva pozadí hex (přepíše config)')
     parser.add_argument('--auto-upscale', action='store_true', help='Zapnout automatický upscale (přepíše config)')
     parser.add_argument('--no-auto-upscale', dest='auto_upscale', action='store_false', help='Vypnout automatický upscale (přepíše config)')
+    parser.add_argument('--workers', type=int, help='Počet paralelních procesů (výchozí: počet CPU)')
+    parser.add_argument('--verbose', action='store_true', help='Vypisovat průběh zpracování každého obrázku')
     
     args = parser.parse_args()
     
+    # Bez --verbose jen varování a chyby, průběh ukazuje tqdm
+    _setup_logging(logging.DEBUG if args.verbose else logging.WARNING)
+    
     # Načtení konfigurace
     config = load_config(args.config)
     
@@ -507,6 +671,10 @@ def main():
         config['target_size'][1] = args.height
     if args.quality:
         config['quality'] = args.quality
+    if args.optimize:
+        config['jpeg_optimize'] = True
+    if args.subsampling is not None:
+        config['jpeg_subsampling'] = args.subsampling
     if args.background_color:
         config['background_color'] = args.background_color
     if args.auto_upscale is not None:
@@ -517,6 +685,8 @@ def main():
         'target_width': config['target_size'][0],
         'target_height': config['target_size'][1],
         'quality': config['quality'],
+        'jpeg_optimize': config.get('jpeg_optimize', False),
+        'jpeg_subsampling': config.get('jpeg_subsampling', 2),
         'input_dir': config['input_dir'],
         'output_dir': config['output_dir'],
         'background_color': config['background_color'],
@@ -524,7 +694,10 @@ def main():
         'product_size_ratio': config['product_size_ratio'],
         'auto_upscale': config['auto_upscale'],
         'upscale_threshold': config['upscale_threshold'],
-        'upscale_method': config['upscale_method']
+        'upscale_min_pixels': config.get('upscale_min_pixels', 500000),
+        'upscale_method': config['upscale_method'],
+        'jpeg_draft': config.get('jpeg_draft', True),
+        'max_workers': args.workers or config.get('max_workers')
     }
     
     # Kontrola existence vstupní složky